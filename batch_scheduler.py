@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# A batch job goes queued -> filtering -> encoding -> done (or failed). Frames are encoded while
+# they are filtered (see FFmpegWriter), so "encoding" is the tail where the filter work is done
+# and ffmpeg is flushing its lookahead. A job gives up its filter slot at that point, which lets
+# the next file start filtering while the previous one is still being encoded.
+
+QUEUED, FILTERING, ENCODING, DONE, FAILED = "queued", "filtering", "encoding", "done", "failed"
+SKIPPED = "skipped"  # output already up to date (see manifest.py)
+
+
+def new_job(file_path, state=QUEUED) -> dict:
+    return {
+        "file_path": Path(file_path),
+        "state": state,
+        "output_path": None,
+        "seconds": None,
+        "source_bytes": os.path.getsize(file_path),
+        "output_bytes": None,
+        "error": None,
+    }
+
+
+def run_batch(file_paths, run_job, filter_jobs=1, encode_jobs=1, should_stop=lambda: False, on_update=None):
+    """Run `run_job(file_path, frames_done)` for every file and return the job records.
+
+    `run_job` must call `frames_done()` once the last frame is handed to the encoder, and
+    return the output path once the encode is finished. `file_paths` may be a generator that
+    blocks and never ends (see watch.py): every file is started as soon as it is yielded.
+    """
+    jobs = []
+    filter_slots = threading.Semaphore(filter_jobs)
+    encode_slots = threading.Semaphore(encode_jobs)
+    # a file yielded again while its job still runs (a watched clip that changed) waits for that
+    # job instead of writing the same output next to it
+    file_locks = {}
+
+    def set_state(job, state):
+        job["state"] = state
+        if on_update is not None:
+            on_update(job)
+
+    def run(job):
+        with file_locks[job["file_path"]]:
+            return run_locked(job)
+
+    def run_locked(job):
+        filter_slots.acquire()
+        held = {"filter": True, "encode": False}
+
+        def frames_done():
+            filter_slots.release()
+            held["filter"] = False
+            encode_slots.acquire()
+            held["encode"] = True
+            set_state(job, ENCODING)
+
+        try:
+            if should_stop():
+                return job
+            started = time.perf_counter()
+            set_state(job, FILTERING)
+            job["output_path"] = run_job(job["file_path"], frames_done)
+            job["output_bytes"] = os.path.getsize(job["output_path"])
+            job["seconds"] = time.perf_counter() - started
+            set_state(job, DONE)
+        except Exception as error:
+            job["error"] = str(error)
+            set_state(job, FAILED)
+        finally:
+            if held["filter"]:
+                filter_slots.release()
+            if held["encode"]:
+                encode_slots.release()
+        return job
+
+    def queued_jobs():
+        for file_path in file_paths:
+            try:
+                job = new_job(file_path)
+            except OSError as error:  # gone since it was listed
+                print(f"Skipping {file_path}: {error}")
+                continue
+            file_locks.setdefault(job["file_path"], threading.Lock())
+            jobs.append(job)
+            if on_update is not None:
+                on_update(job)
+            yield job
+
+    with ThreadPoolExecutor(max_workers=filter_jobs + encode_jobs) as pool:
+        # map submits each job as the generator yields it, the slots above bound the work
+        list(pool.map(run, queued_jobs()))
+    return jobs
+
+
+def batch_summary(jobs) -> str:
+    lines = []
+    for job in jobs:
+        line = f"{job['file_path'].name}: {job['state']}"
+        if job["state"] == DONE:
+            saved = job["source_bytes"] - job["output_bytes"]
+            line += f" in {job['seconds']:.1f}s, saved {saved / 1024000:.3f} MB"
+        elif job["error"]:
+            line += f" ({job['error']})"
+        lines.append(line)
+    return "\n".join(lines)
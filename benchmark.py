@@ -0,0 +1,176 @@
+"""Benchmarks for image_editing_functions on synthetic frames.
+
+    python benchmark.py --output run.json                  # time every case at 720p/1080p/4K
+    python benchmark.py --save-reference reference.npz     # store the outputs of every case
+    python benchmark.py --check-reference reference.npz    # compare outputs to the stored ones
+    python benchmark.py --compare base.json run.json       # report regressions between two runs
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+import image_editing_functions as ief
+
+RESOLUTIONS = {"720p": (1280, 720), "1080p": (1920, 1080), "4k": (3840, 2160)}
+REFERENCE_SIZE = (320, 180)  # outputs stored in the reference file are computed at this size
+
+ALL_STAGES = {
+    "zoom_percentage": 40,
+    "sharpen_percentage": 30,
+    "contrast_percentage": 10,
+    "saturation_percentage": -20,
+    "shadow_percentage": 15,
+    "highlight_percentage": 25,
+    "shift_x": 40,
+    "shift_y": -20,
+}
+
+FIX_FRAME_GRID = {
+    "defaults": {},
+    "colour_only": {"zoom_percentage": 0, "sharpen_percentage": 0, "width": 0, "height": 0},
+    "all_stages": ALL_STAGES,
+    "all_stages_strips": {**ALL_STAGES, "strips": 4},
+    "all_stages_fast": {**ALL_STAGES, "accurate": False},
+    "all_stages_umat": {**ALL_STAGES, "backend": "umat"},
+    "brighten": {"shadow_percentage": -10, "highlight_percentage": -30, "saturation_percentage": 30},
+    "downscale_colour_at_output": {
+        "zoom_percentage": 0,
+        "sharpen_percentage": 30,
+        "contrast_percentage": 10,
+        "saturation_percentage": -20,
+        "highlight_percentage": 25,
+        "half_size": True,
+        "colour_at_output": True,
+    },
+}
+
+
+def synthetic_frame(width: int, height: int, seed: int = 0) -> np.ndarray:
+    # gradients for the colour curves, blocks for edges and noise for the sharpening
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    frame = np.empty((height, width, 3), dtype=np.float32)
+    frame[..., 0] = 255 * x / width
+    frame[..., 1] = 255 * y / height
+    frame[..., 2] = 127 + 127 * np.sin(x / 37) * np.cos(y / 23)
+    frame[(x // 64 + y // 64) % 2 == 0] *= 0.6
+    frame += rng.normal(0, 8, frame.shape)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def benchmark_cases(width: int, height: int):
+    """(name, function) pairs; every function takes a frame and returns the processed frame."""
+    cases = [
+        ("shift_frame", lambda frame: ief.shift_frame(frame, 40, -20)),
+        ("zoom", lambda frame: ief.zoom(frame, 40)),
+        ("transform_geometry", lambda frame: ief.transform_geometry(frame, 40.5, -20, 40, (width // 2, height // 2))),
+        ("sharpen_image", lambda frame: ief.sharpen_image(frame, 30)),
+        ("sharpen_luma", lambda frame: ief.sharpen_luma(frame, 30)),
+        ("adjust_contrast", lambda frame: ief.adjust_contrast(frame, 10)),
+        ("adjust_saturation", lambda frame: ief.adjust_saturation(frame, -20)),
+        ("add_shadow", lambda frame: ief.add_shadow(frame, 15)),
+        ("add_highlight", lambda frame: ief.add_highlight(frame, 25)),
+        ("resize_frame", lambda frame: ief.resize_frame(frame, width // 2, height // 2)),
+    ]
+    for grid_name, params in FIX_FRAME_GRID.items():
+        params = {"width": width, "height": height, **params}
+        if params.pop("half_size", False):
+            params["width"], params["height"] = width // 2, height // 2
+        cases.append((f"fix_frame[{grid_name}]", lambda frame, params=params: ief.fix_frame(frame, **params)))
+    return cases
+
+
+def time_case(function, frame: np.ndarray, repeat: int) -> dict:
+    function(frame)  # warm up caches (colour plans, OpenCV buffers)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(frame)
+        samples.append(time.perf_counter() - start)
+    best = min(samples)
+    return {"best_ms": best * 1000, "median_ms": float(np.median(samples)) * 1000, "fps": 1 / best}
+
+
+def run_benchmarks(resolutions, repeat=5) -> dict:
+    results = {}
+    for resolution in resolutions:
+        width, height = RESOLUTIONS[resolution]
+        frame = synthetic_frame(width, height)
+        for name, function in benchmark_cases(width, height):
+            result = time_case(function, frame, repeat)
+            results[f"{resolution}/{name}"] = result
+            print(f"{resolution:>6} {name:<40} {result['best_ms']:9.2f} ms {result['fps']:9.1f} fps")
+    return results
+
+
+def reference_outputs() -> dict:
+    width, height = REFERENCE_SIZE
+    frame = synthetic_frame(width, height)
+    return {name: function(frame) for name, function in benchmark_cases(width, height)}
+
+
+def check_reference(reference_path, tolerance=1) -> bool:
+    reference = np.load(reference_path)
+    ok = True
+    for name, output in reference_outputs().items():
+        if name not in reference.files:
+            print(f"{name:<40} FAIL missing from reference")
+            ok = False
+            continue
+        expected = reference[name]
+        if expected.shape != output.shape:
+            print(f"{name:<40} FAIL shape {output.shape} != {expected.shape}")
+            ok = False
+            continue
+        diff = int(np.abs(expected.astype(np.int16) - output).max()) if output.size else 0
+        status = "ok" if diff <= tolerance else "FAIL"
+        ok &= diff <= tolerance
+        print(f"{name:<40} {status} max diff {diff}")
+    return ok
+
+
+def compare_runs(base_path, new_path, threshold=0.1) -> bool:
+    with open(base_path) as base_file, open(new_path) as new_file:
+        base, new = json.load(base_file), json.load(new_file)
+    ok = True
+    for name in sorted(base.keys() & new.keys()):
+        change = new[name]["best_ms"] / base[name]["best_ms"] - 1
+        regression = change > threshold
+        ok &= not regression
+        marker = "REGRESSION" if regression else ""
+        print(f"{name:<46} {base[name]['best_ms']:9.2f} -> {new[name]['best_ms']:9.2f} ms {change:+7.1%} {marker}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark image_editing_functions on synthetic frames.")
+    parser.add_argument("--resolutions", nargs="+", choices=list(RESOLUTIONS), default=list(RESOLUTIONS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the timings to this JSON file")
+    parser.add_argument("--save-reference", help="store the outputs of every case in this .npz file")
+    parser.add_argument("--check-reference", help="compare the outputs against this .npz file")
+    parser.add_argument("--tolerance", type=int, default=1, help="allowed difference per channel")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two --output files")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 0 if compare_runs(*args.compare, threshold=args.threshold) else 1
+    if args.save_reference:
+        np.savez_compressed(args.save_reference, **reference_outputs())
+        print(f"Reference written to {args.save_reference}")
+        return 0
+    if args.check_reference:
+        return 0 if check_reference(args.check_reference, args.tolerance) else 1
+
+    results = run_benchmarks(args.resolutions, args.repeat)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
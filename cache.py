@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Small in-process caches keyed by content: files by (path, mtime, size), processed frames by a
+# hash of the params dict. Cached frames are made read-only, since every caller shares them.
+
+FRAME_CACHE_BYTES = 512 * 1024 * 1024
+PROBE_CACHE_BYTES = 4 * 1024 * 1024
+
+
+def _size_of(value) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, tuple):
+        return sum(_size_of(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """Thread-safe LRU mapping that evicts the oldest entries to stay within `max_bytes`."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key, value):
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        size = _size_of(value)
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            if size > self.max_bytes:
+                return value
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self.bytes -= self.entries.popitem(last=False)[1][1]
+        return value
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+
+frame_cache = LRUCache(FRAME_CACHE_BYTES)
+probe_cache = LRUCache(PROBE_CACHE_BYTES)
+
+
+def file_key(path) -> tuple:
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def params_key(params: dict) -> str:
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def read_frame(path, frame_index: int = 0, keyframe=None):
+    # with a known keyframe at or before frame_index, seek there and decode forward; grab()
+    # skips the colour conversion of the frames in between
+    video_capture = cv2.VideoCapture(str(path))
+    start = frame_index if keyframe is None else keyframe
+    if start:
+        video_capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+    ret = True
+    for _ in range(frame_index - start):
+        ret = ret and video_capture.grab()
+    if ret:
+        ret, frame = video_capture.read()
+    video_capture.release()
+    return frame if ret else None
+
+
+def cached_frame(path, frame_index: int = 0, keyframe=None):
+    """The decoded frame `frame_index` of `path` (None if it cannot be read)."""
+    return frame_cache.get_or_compute(
+        ("frame", file_key(path), frame_index), lambda: read_frame(path, frame_index, keyframe)
+    )
+
+
+def _probe_capture(video_capture) -> dict:
+    fps = video_capture.get(cv2.CAP_PROP_FPS)
+    frame_count = int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    return {
+        "fps": fps,
+        "frame_count": frame_count,
+        "width": int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "duration": frame_count / fps if fps else 0.0,
+    }
+
+
+def probe_video(path, video_capture=None) -> dict:
+    """fps, frame_count, width, height and duration of `path`, from the container header.
+
+    An already open capture of the same file can be passed to avoid opening it again.
+    """
+
+    def probe():
+        if video_capture is not None:
+            return _probe_capture(video_capture)
+        capture = cv2.VideoCapture(str(path))
+        try:
+            return _probe_capture(capture)
+        finally:
+            capture.release()
+
+    return probe_cache.get_or_compute(("probe", file_key(path)), probe)
@@ -1,9 +1,20 @@
+import json
+import os
+import shutil
 import subprocess
+import tempfile
+import threading
+from dataclasses import asdict, dataclass
+import numpy as np
 from tqdm import tqdm
-import re
-import builtins
+import time
+import cv2
+from cache import file_key, probe_cache
+from manifest import PARTIAL_MARKER
 
-progress_pattern = re.compile(r"time=(\d+:\d+:\d+\.\d+)")
+# ffmpeg writes key=value progress blocks to stdout (ending in progress=continue|end) instead of
+# the \r separated stats line on stderr, which is then left to the log
+PROGRESS_ARGS = ["-progress", "pipe:1", "-nostats"]
 
 
 # First, get the total duration using ffprobe
@@ -20,50 +31,404 @@ def duration_command(input_file: str):
     ]
 
 
-def compress_with_ffmpeg(input_file: str, output_file: str, target_bitrate="4000k", crf_value="32"):
-    duration_output = subprocess.run(duration_command(input_file), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    total_duration = float(duration_output.stdout)
+# Named encoder settings; every key is an encoder_args argument. The bitrate given with a
+# profile (--bitrate) caps the CRF encode instead of fighting it.
+ENCODING_PROFILES = {
+    "default": {"codec": "libx264", "preset": "slow", "crf_value": "32"},
+    "fast": {"codec": "libx264", "preset": "veryfast", "crf_value": "26"},
+    "balanced": {"codec": "libx264", "preset": "medium", "crf_value": "24"},
+    "archival": {"codec": "libx265", "preset": "slow", "crf_value": "24"},
+}
+AUTO_PROFILE = "auto"
+TUNING_CRFS = ("23", "28", "32")
+TUNING_PRESETS = ("veryfast", "medium", "slow")
+
+
+def encoder_settings(profile="default", target_bitrate=None) -> dict:
+    return {**ENCODING_PROFILES[profile], "target_bitrate": target_bitrate}
+
+
+def encoder_args(target_bitrate="4000k", crf_value="32", preset="slow", codec="libx264", threads=None, tune=None):
+    # -crf and -b:v together made libx264 silently ignore the bitrate; with a CRF the bitrate is
+    # now a VBV cap (maxrate), without one it is the average bitrate
+    args = ["-c:v", codec]
+    if crf_value is not None:
+        args += ["-crf", str(crf_value)]
+        if target_bitrate:
+            args += ["-maxrate", target_bitrate, "-bufsize", bitrate_times(target_bitrate, 2)]
+    elif target_bitrate:
+        args += ["-b:v", target_bitrate]
+    args += ["-preset", preset]  # A slower preset will provide better compression
+    if tune:
+        args += ["-tune", tune]
+    if threads:
+        args += ["-threads", str(threads)]
+    if codec == "libx265":
+        args += ["-tag:v", "hvc1"]  # so QuickTime / Premiere accept the mp4
+    return [*args, "-an"]
+
+
+def bitrate_to_kbps(bitrate) -> float:
+    # ffmpeg style "4000k" / "4M" / "4000000"
+    bitrate = str(bitrate).strip().lower()
+    scale = {"k": 1, "m": 1000}.get(bitrate[-1:])
+    return float(bitrate[:-1]) * scale if scale else float(bitrate) / 1000
+
+
+def bitrate_times(bitrate, factor: float) -> str:
+    return f"{bitrate_to_kbps(bitrate) * factor:.0f}k"
+
+
+def time_to_seconds(time_str: str) -> float:
+    hours, minutes, seconds = map(float, time_str.split(":"))
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def probe_duration(input_file: str) -> float:
+    # cached per file identity, so a file is only run through ffprobe once
+    def probe():
+        duration_output = subprocess.run(duration_command(input_file), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return float(duration_output.stdout)
+
+    return probe_cache.get_or_compute(("duration", file_key(input_file)), probe)
+
+
+def keyframe_command(input_file: str):
+    # packet scan only, nothing is decoded
+    return [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "packet=pts_time,flags",
+        "-of",
+        "csv=p=0",
+        input_file,
+    ]
+
+
+def scan_packets(input_file: str) -> tuple:
+    """(pts_time, is_keyframe) of every video packet of `input_file` in decode order, () if ffprobe fails."""
+
+    def probe():
+        try:
+            probe_output = subprocess.run(keyframe_command(input_file), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        except OSError:
+            return ()
+        if probe_output.returncode != 0:
+            return ()
+        packets = []
+        for line in probe_output.stdout.splitlines():
+            pts_time, _, flags = line.partition(",")
+            if pts_time not in ("", "N/A"):
+                packets.append((float(pts_time), "K" in flags))
+        return tuple(packets)
+
+    return probe_cache.get_or_compute(("packets", file_key(input_file)), probe)
+
+
+def keyframe_times(input_file: str) -> list:
+    """Presentation times (seconds) of the video keyframes of `input_file`, [] if ffprobe fails."""
+    return sorted(pts_time for pts_time, is_key in scan_packets(input_file) if is_key)
+
+
+def concat_segments(segment_files, output_file: str):
+    # lossless join with the concat demuxer; the segments share the same encoder settings
+    list_file = f"{output_file}.segments.txt"
+    with open(list_file, "w") as segments:
+        for segment_file in segment_files:
+            escaped = str(segment_file).replace("\\", "/").replace("'", "'\\''")
+            segments.write(f"file '{escaped}'\n")
+    try:
+        subprocess.run(
+            ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_file, "-c", "copy", output_file],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+    finally:
+        os.remove(list_file)
+
+
+# ============= PROGRESS ==============================
+# Every ffmpeg process gets its own ProgressMonitor, which turns the progress blocks into
+# ProgressEvents and hands them to its subscribers (any callable taking the event).
+
+
+@dataclass
+class ProgressEvent:
+    output_file: str
+    frame: int = 0
+    fps: float = 0.0
+    speed: float = 0.0  # times realtime
+    out_time: float = 0.0  # seconds of output encoded
+    bitrate: float = 0.0  # kbps
+    total_size: int = 0  # bytes
+    done: bool = False
+
+    def text(self) -> str:
+        return (
+            f"{os.path.basename(self.output_file)}: {self.out_time:.1f}s encoded, {self.fps:.1f} fps, "
+            f"{self.speed:.2f}x, {self.bitrate:.0f} kbps, {self.total_size / 1024000:.2f} MB"
+        )
+
+
+def _progress_number(value: str, suffix: str = "") -> float:
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[: -len(suffix)]
+    try:
+        return float(value)
+    except ValueError:  # N/A before the first packet
+        return 0.0
+
+
+def progress_event(output_file: str, fields: dict) -> ProgressEvent:
+    out_time = fields.get("out_time", "")
+    return ProgressEvent(
+        output_file=output_file,
+        frame=int(_progress_number(fields.get("frame", ""))),
+        fps=_progress_number(fields.get("fps", "")),
+        speed=_progress_number(fields.get("speed", ""), "x"),
+        out_time=time_to_seconds(out_time) if out_time.count(":") == 2 and not out_time.startswith("-") else 0.0,
+        bitrate=_progress_number(fields.get("bitrate", ""), "kbits/s"),
+        total_size=int(_progress_number(fields.get("total_size", ""))),
+        done=fields.get("progress") == "end",
+    )
+
+
+class ProgressMonitor:
+    """Reads the progress (stdout) and the log (stderr) of one ffmpeg process on reader threads."""
+
+    def __init__(self, process, output_file: str, subscribers=()):
+        self.process = process
+        self.output_file = output_file
+        self.subscribers = list(subscribers)
+        self.stderr_lines = []
+        self.last_event = None
+        self.threads = [
+            threading.Thread(target=self._read_progress, daemon=True),
+            threading.Thread(target=self._read_stderr, daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def _read_progress(self):
+        fields = {}
+        for line in self.process.stdout:
+            key, _, value = line.decode(errors="replace").strip().partition("=")
+            fields[key] = value
+            if key == "progress":
+                self.last_event = progress_event(self.output_file, fields)
+                for subscriber in list(self.subscribers):
+                    try:
+                        subscriber(self.last_event)
+                    except Exception as error:
+                        # dropped, but the pipe keeps being read: a full stdout would stall ffmpeg
+                        print(f"Progress subscriber {subscriber!r} failed and was removed: {error}")
+                        self.subscribers.remove(subscriber)
+                fields = {}
+
+    def _read_stderr(self):
+        for line in self.process.stderr:
+            self.stderr_lines = (self.stderr_lines + [line.decode(errors="replace").rstrip()])[-20:]
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+
+class TqdmProgress:
+    """Subscriber drawing the encoded seconds as a tqdm bar."""
+
+    def __init__(self, total_seconds=None, desc=None):
+        self.bar = tqdm(total=total_seconds, unit="s", desc=desc)
+
+    def __call__(self, event: ProgressEvent):
+        self.bar.update(event.out_time - self.bar.n)
+        if event.done:
+            self.bar.close()
+
+
+class JsonProgressLog:
+    """Subscriber appending every event as a JSON line; one log can be shared by several encodes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def __call__(self, event: ProgressEvent):
+        with self.lock, open(self.path, "a") as log_file:
+            log_file.write(json.dumps({"time": time.time(), **asdict(event)}) + "\n")
+
+
+def report_result(returncode: int, stderr_lines):
+    if returncode == 0:
+        print("Compression finished successfully.")
+    else:
+        print("Compression failed with return code", returncode)
+        print("Error message:", "\n".join(stderr_lines))
+
+
+def compress_with_ffmpeg(input_file: str, output_file: str, target_bitrate="4000k", crf_value="32", subscribers=None):
+    if subscribers is None:
+        subscribers = [TqdmProgress(probe_duration(input_file))]
 
-    # Now start the ffmpeg process
     ffmpeg_command = [
         "ffmpeg",
         "-y",  # Overwrite without asking if the output file exists
+        *PROGRESS_ARGS,
         "-i",
         input_file,
-        "-c:v",
-        "libx264",
-        "-b:v",
-        target_bitrate,
-        "-crf",
-        crf_value,
-        "-preset",
-        "slow",  # A slower preset will provide better compression
-        "-an",
+        *encoder_args(target_bitrate, crf_value),
         output_file,
     ]
+    process = subprocess.Popen(ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    monitor = ProgressMonitor(process, output_file, subscribers)
+    returncode = process.wait()
+    monitor.join()
+    report_result(returncode, monitor.stderr_lines)
+    return returncode
 
-    process = subprocess.Popen(ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-
-    # Initialize tqdm progress bar
-    with tqdm(total=total_duration, unit="s") as bar:
-        while True:
-            line = process.stderr.readline() # type: ignore
-            if not line:
-                break
-            if match := progress_pattern.search(line):
-                time_str = match.group(1)
-                hours, minutes, seconds = map(float, time_str.split(":"))
-                current_time = hours * 3600 + minutes * 60 + seconds
-                setattr(builtins, "compression", current_time)
-                bar.update(current_time - bar.n)  # update progress bar
-
-    # Check if the compression finished successfully
-    setattr(builtins, "compression", "started")
-    process.wait()  # Wait for the ffmpeg process to finish
-    if process.returncode == 0:
-        setattr(builtins, "compression", "Done")
-        print("Compression finished successfully.")
+
+# ============= STREAMING ENCODER ==============================
+# Processed frames are piped as raw BGR straight into a single libx264 encode, instead of
+# writing an mp4v intermediate with OpenCV and re-encoding it with compress_with_ffmpeg.
+
+
+def pipe_command(output_file: str, frame_rate: float, width: int, height: int, **encoder):
+    return [
+        "ffmpeg",
+        "-y",
+        *PROGRESS_ARGS,
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "bgr24",
+        "-s",
+        f"{width}x{height}",
+        "-r",
+        str(frame_rate),
+        "-i",
+        "-",
+        *encoder_args(**encoder),
+        "-pix_fmt",
+        "yuv420p",  # what the mp4v -> libx264 route produced; bgr24 input would pick 4:4:4
+        output_file,
+    ]
+
+
+class FFmpegWriter:
+    """Drop-in for cv2.VideoWriter (write / release) that encodes through an ffmpeg pipe.
+
+    The process starts on the first frame, so the size always matches what fix_frame returns.
+    Progress events name `report_as` (e.g. the final name of a .partial output) if given.
+    """
+
+    def __init__(
+        self, output_file: str, frame_rate: float, target_bitrate="4000k", crf_value="32", preset="slow",
+        subscribers=(), report_as=None, **encoder,
+    ):
+        self.output_file = output_file
+        self.report_as = report_as or output_file
+        self.frame_rate = frame_rate
+        self.encoder_options = {"target_bitrate": target_bitrate, "crf_value": crf_value, "preset": preset, **encoder}
+        self.subscribers = subscribers
+        self.process = None
+        self.monitor = None
+        self.returncode = None
+
+    def _start(self, width: int, height: int):
+        command = pipe_command(self.output_file, self.frame_rate, width, height, **self.encoder_options)
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        self.monitor = ProgressMonitor(self.process, self.report_as, self.subscribers)
+
+    def write(self, frame):
+        if self.process is None:
+            height, width = frame.shape[:2]
+            self._start(width, height)
+        self.process.stdin.write(np.ascontiguousarray(frame).data)  # type: ignore
+
+    def release(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()  # type: ignore
+        except BrokenPipeError:  # ffmpeg already exited; its return code and stderr tell why
+            pass
+        self.returncode = self.process.wait()
+        self.monitor.join()
+        report_result(self.returncode, self.monitor.stderr_lines)
+
+
+# ============= AUTO TUNING ==============================
+# Encodes a few already processed sample frames with every CRF/preset pair on the CPU, and
+# picks the fastest encode that stays under the target bitrate (or above a PSNR).
+
+
+def sample_encode(frames, frame_rate: float, output_file: str, **encoder) -> dict:
+    out = FFmpegWriter(output_file, frame_rate, **encoder)
+    start = time.perf_counter()
+    for frame in frames:
+        out.write(frame)
+    out.release()
+    seconds = time.perf_counter() - start
+    result = {"encoder": encoder, "returncode": out.returncode, "encode_fps": len(frames) / max(seconds, 1e-9)}
+    if out.returncode != 0:
+        return result
+    result["kbps"] = os.path.getsize(output_file) * 8 / 1000 / (len(frames) / frame_rate)
+    capture = cv2.VideoCapture(output_file)
+    psnrs = []
+    for frame in frames:
+        ret, decoded = capture.read()
+        if not ret:
+            break
+        psnrs.append(min(cv2.PSNR(frame, decoded), 100.0))  # identical frames give 361
+    capture.release()
+    result["psnr"] = float(np.mean(psnrs)) if psnrs else 0.0
+    os.remove(output_file)
+    return result
+
+
+def tune_encoder(frames, frame_rate: float, work_dir: str, target_bitrate=None, min_psnr=None, codec="libx264"):
+    """The encoder settings for `frames` (see sample_encode) and the results of every candidate.
+
+    With `min_psnr`, the fastest encode that reaches it wins. Otherwise the best quality that
+    stays under `target_bitrate` wins (lowest CRF, then the fastest preset at that CRF). If no
+    candidate qualifies, the closest one is used.
+    """
+    # a directory of its own, so files tuned side by side don't share sample names; the
+    # .partial name lets remove_partial_outputs clear it after a crash
+    sample_dir = tempfile.mkdtemp(prefix=".tune_", suffix=f"{PARTIAL_MARKER}.d", dir=work_dir)
+    try:
+        results = [
+            sample_encode(
+                frames, frame_rate, os.path.join(sample_dir, f"{preset}_{crf}.mp4"),
+                codec=codec, preset=preset, crf_value=crf, target_bitrate=None,
+            )
+            for crf in TUNING_CRFS
+            for preset in TUNING_PRESETS
+        ]
+    finally:
+        shutil.rmtree(sample_dir, ignore_errors=True)
+    results = [result for result in results if result["returncode"] == 0]
+    if not results:
+        raise RuntimeError("no sample encode succeeded")
+    if min_psnr is not None:
+        qualifying = [result for result in results if result["psnr"] >= min_psnr]
+        closest = max(results, key=lambda result: result["psnr"])
+        best = max(qualifying, key=lambda result: result["encode_fps"], default=None)
     else:
-        setattr(builtins, "compression", "error")
-        print("Compression failed with return code", process.returncode)
-        print("Error message:", process.stderr.read()) # type: ignore
+        # the fastest under the cap would always be the highest CRF, below the default profile
+        limit = bitrate_to_kbps(target_bitrate) if target_bitrate else float("inf")
+        qualifying = [result for result in results if result["kbps"] <= limit]
+        closest = min(results, key=lambda result: result["kbps"])
+        best = max(
+            qualifying, key=lambda result: (-int(result["encoder"]["crf_value"]), result["encode_fps"]), default=None
+        )
+    chosen = best or closest
+    return {**chosen["encoder"], "target_bitrate": target_bitrate}, results
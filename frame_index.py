@@ -0,0 +1,102 @@
+import bisect
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import cv2
+
+from cache import cached_frame, file_key, probe_cache
+from compression import scan_packets
+
+# Random access into a source for the preview timeline. Every file gets an index of its frame
+# count and keyframe positions (frame numbers in presentation order), built once from an
+# ffprobe packet scan (nothing is decoded) and kept on disk in INDEX_DIR. Without ffprobe a
+# grab-only pass counts the frames and the keyframes stay unknown. A frame is then read by
+# seeking to the nearest keyframe at or before it and decoding forward from there.
+
+INDEX_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "video_frame_fixer" / "index"
+INDEX_VERSION = 1
+
+_build_lock = threading.Lock()
+
+
+def index_path(path) -> Path:
+    return INDEX_DIR / f"{hashlib.sha1(os.path.abspath(path).encode()).hexdigest()}.json"
+
+
+def packet_index(path):
+    # (frame count, keyframe frame numbers) from the packet list, None if ffprobe fails
+    packets = sorted(scan_packets(str(path)))  # decode order; sorted by pts gives the frame numbers
+    if not packets:
+        return None
+    return len(packets), [number for number, (_, is_key) in enumerate(packets) if is_key]
+
+
+def count_frames(path) -> int:
+    video_capture = cv2.VideoCapture(str(path))
+    frame_count = 0
+    while video_capture.grab():
+        frame_count += 1
+    video_capture.release()
+    return frame_count
+
+
+def build_index(path) -> dict:
+    scanned = packet_index(path)
+    frame_count, keyframes = scanned if scanned is not None else (count_frames(path), [])
+    return {"frame_count": frame_count, "keyframes": keyframes}
+
+
+def _load_or_build(path) -> dict:
+    key = list(file_key(path))
+    stored_path = index_path(path)
+    try:
+        stored = json.loads(stored_path.read_text())
+        if stored.get("version") == INDEX_VERSION and stored.get("source") == key:
+            return stored
+    except (OSError, ValueError):
+        pass
+    index = {"version": INDEX_VERSION, "source": key, **build_index(path)}
+    try:
+        stored_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = stored_path.with_name(stored_path.name + ".tmp")
+        temp_path.write_text(json.dumps(index))
+        os.replace(temp_path, stored_path)
+    except OSError as error:
+        print(f"Could not store the frame index of {path}: {error}")
+    return index
+
+
+def frame_index(path) -> dict:
+    """frame_count and keyframes of `path`, from memory, the on-disk index or a fresh scan."""
+    with _build_lock:  # a scan already running (see warm_index) is waited for, not repeated
+        return probe_cache.get_or_compute(("index", file_key(path)), lambda: _load_or_build(path))
+
+
+def warm_index(path):
+    # builds the index in the background so the first timeline move does not wait for it
+    threading.Thread(target=frame_index, args=(path,), daemon=True).start()
+
+
+def nearest_keyframe(keyframes, frame_number: int):
+    # None when the keyframes are unknown, which leaves the seek to OpenCV
+    position = bisect.bisect_right(keyframes, frame_number)
+    return keyframes[position - 1] if position else None
+
+
+def timeline_frame(path, position: float) -> int:
+    """The frame number at `position` (0-100 %) of the timeline of `path`."""
+    if position <= 0:
+        return 0
+    frame_count = frame_index(path)["frame_count"]
+    return max(min(int(position / 100 * frame_count), frame_count - 1), 0)
+
+
+def indexed_frame(path, frame_number: int):
+    """The decoded frame `frame_number` of `path`, read from its nearest keyframe."""
+    if frame_number == 0:
+        return cached_frame(path, 0)
+    keyframe = nearest_keyframe(frame_index(path)["keyframes"], frame_number)
+    return cached_frame(path, frame_number, keyframe)
@@ -1,11 +1,11 @@
 import cv2
-print("OpenCL available:", cv2.ocl.haveOpenCL())
-if cv2.ocl.haveOpenCL():
-    cv2.ocl.setUseOpenCL(True)
-    print("OpenCL enabled")
-
 import numpy as np
 import builtins
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from profiling import timed
 
 
 def shift_frame(frame: np.ndarray, x: int, y: int):
@@ -16,7 +16,9 @@ def shift_frame(frame: np.ndarray, x: int, y: int):
     return cv2.warpAffine(frame, M, (w, h), borderValue=[255, 255, 255])  # type: ignore
 
 
-def sharpen_image(frame: np.ndarray, percentage: float, color_preservation=False) -> np.ndarray:
+def sharpen_image(
+    frame: np.ndarray, percentage: float, color_preservation=False, sigma=3.0, dst=None, blur_dst=None
+) -> np.ndarray:
     if percentage == 0:
         return frame
     percentage = max(0, min(100, percentage)) / 100
@@ -26,15 +28,36 @@ def sharpen_image(frame: np.ndarray, percentage: float, color_preservation=False
         frame_yuv[..., 0] = cv2.GaussianBlur(frame_yuv[..., 0], (0, 0), sigmaX=1, sigmaY=1)
         blurred = cv2.cvtColor(frame_yuv, cv2.COLOR_YUV2BGR)
     else:
-        blurred = cv2.GaussianBlur(frame, (0, 0), sigmaX=3, sigmaY=3)
+        blurred = cv2.GaussianBlur(frame, (0, 0), sigmaX=sigma, sigmaY=sigma, dst=blur_dst)
 
-    sharpened = cv2.addWeighted(frame, 1.0 + percentage, blurred, -percentage, 0)
-    sharpened = np.clip(sharpened, 0, 255)  # Clipping to ensure values are in the valid range
-    return sharpened
+    # addWeighted saturates uint8 results, so no extra clipping pass is needed
+    return cv2.addWeighted(frame, 1.0 + percentage, blurred, -percentage, 0, dst=dst)
 
 
-def zoom(frame: np.ndarray, percentage: int = 60) -> np.ndarray:
-    h, w, _ = frame.shape
+def sharpen_luma(frame: np.ndarray, percentage: float, sigma=3.0, dst=None) -> np.ndarray:
+    # fast unsharp mask: blur only the luma (one channel instead of three, fixed-point Gaussian)
+    # and add the same detail to B, G and R. Not identical to sharpen_image, whose detail
+    # differs per channel; fix_frame(..., accurate=True) keeps that one.
+    if percentage == 0:
+        return frame
+    amount = max(0, min(100, percentage)) / 100
+    luma = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    blurred = cv2.GaussianBlur(luma, (0, 0), sigmaX=sigma, sigmaY=sigma)
+    # the positive and negative halves of amount * (luma - blurred), each saturated at 0
+    raised = cv2.addWeighted(luma, amount, blurred, -amount, 0)
+    lowered = cv2.addWeighted(blurred, amount, luma, -amount, 0)
+    return _add_detail(frame, raised, lowered, dst)
+
+
+def _add_detail(frame: np.ndarray, raised: np.ndarray, lowered: np.ndarray, dst=None) -> np.ndarray:
+    # frame + raised - lowered on every channel, with uint8 saturating adds only (at most one of
+    # the two is non-zero per pixel, so this equals a signed add and a single clip)
+    out = cv2.add(frame, cv2.cvtColor(raised, cv2.COLOR_GRAY2BGR), dst=dst)
+    return cv2.subtract(out, cv2.cvtColor(lowered, cv2.COLOR_GRAY2BGR), dst=out)
+
+
+def zoom_box(shape, percentage: float = 60):
+    h, w = shape[:2]
     percentage = 100-percentage
     crop_margin_x = w * ((100 - percentage) / 100) / 2
     crop_margin_y = h * ((100 - percentage) / 100) / 2
@@ -42,11 +65,60 @@ def zoom(frame: np.ndarray, percentage: int = 60) -> np.ndarray:
     y1 = int(crop_margin_y)
     x2 = int(w - crop_margin_x)
     y2 = int(h - crop_margin_y)
+    return x1, y1, x2, y2
+
+
+def zoom(frame: np.ndarray, percentage: int = 60) -> np.ndarray:
+    x1, y1, x2, y2 = zoom_box(frame.shape, percentage)
     return frame[y1:y2, x1:x2]
 
 
-def resize_frame(frame: np.ndarray, width: int, height: int):
-    return cv2.resize(frame, (width, height))
+INTERPOLATIONS = {
+    "nearest": cv2.INTER_NEAREST,
+    "linear": cv2.INTER_LINEAR,
+    "cubic": cv2.INTER_CUBIC,
+    "area": cv2.INTER_AREA,
+    "lanczos": cv2.INTER_LANCZOS4,
+}
+
+
+def resize_frame(frame: np.ndarray, width: int, height: int, interpolation="linear", dst=None, source_size=None):
+    # source_size: (width, height) of `frame`, for a cv2.UMat which has no shape
+    if (source_size or (frame.shape[1], frame.shape[0])) == (width, height):
+        return frame
+    return cv2.resize(frame, (width, height), dst=dst, interpolation=INTERPOLATIONS[interpolation])
+
+
+def transform_geometry(
+    frame: np.ndarray, shift_x, shift_y, zoom_percentage, size, interpolation="linear", dst=None, upload=None
+):
+    # shift_frame + zoom + resize_frame as a single resampling pass straight to `size`
+    # upload: e.g. cv2.UMat, applied to what is resampled (only the crop when that is a slice)
+    h, w, _ = frame.shape
+    x1, y1, x2, y2 = zoom_box(frame.shape, zoom_percentage)
+    crop_w, crop_h = x2 - x1, y2 - y1
+
+    # a whole-pixel shift only moves the crop window, which is a slice while it stays inside the frame
+    if float(shift_x).is_integer() and float(shift_y).is_integer():
+        left, top = x1 - int(shift_x), y1 - int(shift_y)
+        if left >= 0 and top >= 0 and left + crop_w <= w and top + crop_h <= h:
+            crop = frame[top:top + crop_h, left:left + crop_w]
+            if upload is not None:
+                crop = upload(crop)
+            return resize_frame(crop, *size, interpolation=interpolation, dst=dst, source_size=(crop_w, crop_h))
+
+    # output pixel (u, v) samples the source at (scale * (u + 0.5) - 0.5 + x1 - shift_x, ...)
+    scale_x, scale_y = crop_w / size[0], crop_h / size[1]
+    M = np.float32([  # type: ignore
+        [scale_x, 0, 0.5 * scale_x - 0.5 + x1 - shift_x],
+        [0, scale_y, 0.5 * scale_y - 0.5 + y1 - shift_y],
+    ])
+    flag = INTERPOLATIONS[interpolation]
+    flag = cv2.INTER_LINEAR if flag == cv2.INTER_AREA else flag  # not supported by warpAffine
+    return cv2.warpAffine(
+        frame if upload is None else upload(frame), M, size,
+        dst=dst, flags=flag | cv2.WARP_INVERSE_MAP, borderValue=[255, 255, 255],  # type: ignore
+    )
 
 
 def sharpen_image_old(frame: np.ndarray, percentage: float):
@@ -84,10 +156,8 @@ def add_shadow(frame: np.ndarray, percentage: float):
     return shadow_frame.astype(np.uint8)
 
 
-def add_highlight(frame: np.ndarray, percentage: float):
+def highlight_curve(l_channel: np.ndarray, percentage: float) -> np.ndarray:
     percentage_fix = 400.0
-    lab = cv2.cvtColor(frame, cv2.COLOR_RGB2LAB)
-    l_channel, a_channel, b_channel = cv2.split(lab)
     # Dynamically adjust the highlight threshold based on the percentage
     
     max_threshold = 180  # The maximum threshold when percentage is at its lowest
@@ -102,7 +172,13 @@ def add_highlight(frame: np.ndarray, percentage: float):
     soft_mask = np.clip((l_channel.astype(np.float32) - highlight_threshold) / highlight_diff, 0, 1)
     adjustment_factor = 1 + (percentage / percentage_fix)
     l_channel_adjusted = l_channel * (1 + soft_mask * (adjustment_factor - 1))
-    l_channel_adjusted = np.clip(l_channel_adjusted, 0, 255).astype(np.uint8)
+    return np.clip(l_channel_adjusted, 0, 255).astype(np.uint8)
+
+
+def add_highlight(frame: np.ndarray, percentage: float):
+    lab = cv2.cvtColor(frame, cv2.COLOR_RGB2LAB)
+    l_channel, a_channel, b_channel = cv2.split(lab)
+    l_channel_adjusted = highlight_curve(l_channel, percentage)
     adjusted_lab = cv2.merge([l_channel_adjusted, a_channel, b_channel])
     adjusted_frame = cv2.cvtColor(adjusted_lab, cv2.COLOR_LAB2RGB)
     
@@ -111,6 +187,228 @@ def add_highlight(frame: np.ndarray, percentage: float):
     return adjusted_frame
 
 
+# ============= COLOUR PLAN ==============================
+# The colour stages of fix_frame are all functions of a single channel value (or of one
+# channel in HSV / LAB), so they can be compiled once per parameter set into 256-entry
+# lookup tables and applied with cv2.LUT instead of re-running the float maths per frame.
+
+_RAMP = np.arange(256, dtype=np.uint8).reshape(1, 256)
+
+
+def _lut_or_none(lut: np.ndarray):
+    return None if np.array_equal(lut, _RAMP) else lut
+
+
+def _channel_lut(*channel_luts: np.ndarray) -> np.ndarray:
+    return np.dstack([lut.reshape(1, 256) for lut in channel_luts])
+
+
+@lru_cache(maxsize=32)
+def build_colour_plan(
+    contrast_percentage: float = 0,
+    saturation_percentage: float = 0,
+    shadow_percentage: float = 0,
+    highlight_percentage: float = 0,
+) -> dict:
+    # The tables are built by running the original functions over a 0..255 ramp, so the
+    # rounding / truncation behaviour is identical to the per-frame code.
+    bgr_lut = adjust_contrast(_RAMP, contrast_percentage)
+    hsv_lut, post_lut, lab_lut, highlight_lut = None, None, None, None
+
+    shadow_lut = add_shadow(_RAMP, shadow_percentage)
+    if saturation_percentage == 0:
+        bgr_lut = shadow_lut[0, bgr_lut[0]].reshape(1, 256)
+    else:
+        saturation_lut = cv2.convertScaleAbs(_RAMP, alpha=(100 + saturation_percentage) / 100, beta=0)
+        # shadow stays a separate pass after the HSV round trip: folded into V it is off by one
+        # level, and the final resize can turn that into two
+        hsv_lut = _channel_lut(_RAMP, saturation_lut, _RAMP)
+        post_lut = _lut_or_none(shadow_lut)
+
+    if highlight_percentage != 0:
+        lab_lut = _channel_lut(highlight_curve(_RAMP, highlight_percentage), _RAMP, _RAMP)
+        highlight_lut = _lut_or_none(adjust_contrast(_RAMP, highlight_percentage / 10))
+
+    return {
+        "bgr_lut": _lut_or_none(bgr_lut),
+        "hsv_lut": hsv_lut,
+        "post_lut": post_lut,
+        "lab_lut": lab_lut,
+        "highlight_lut": highlight_lut,
+    }
+
+
+def _apply_lut(frame: np.ndarray, lut: np.ndarray, source: np.ndarray, dst=None) -> np.ndarray:
+    # The first stage writes into dst (or a new array), later ones keep writing into that
+    # buffer, but never into the caller's frame
+    return cv2.LUT(frame, lut, dst=dst if frame is source else frame)
+
+
+def _apply_lut_in_space(frame, lut, to_code, from_code, source, dst=None) -> np.ndarray:
+    converted = cv2.cvtColor(frame, to_code, dst=dst if frame is source else frame)
+    cv2.LUT(converted, lut, dst=converted)
+    return cv2.cvtColor(converted, from_code, dst=converted)
+
+
+def apply_colour_plan(frame: np.ndarray, plan: dict, timings=None, dst=None) -> np.ndarray:
+    source = frame
+    if plan["bgr_lut"] is not None:
+        frame = timed(timings, "contrast", _apply_lut, frame, plan["bgr_lut"], source, dst)
+    if plan["hsv_lut"] is not None:
+        frame = timed(
+            timings, "saturation", _apply_lut_in_space,
+            frame, plan["hsv_lut"], cv2.COLOR_BGR2HSV, cv2.COLOR_HSV2BGR, source, dst,
+        )
+    if plan["post_lut"] is not None:
+        frame = timed(timings, "shadow", _apply_lut, frame, plan["post_lut"], source, dst)
+    if plan["lab_lut"] is not None:
+        # add_highlight treats the frame as RGB, keep that for identical output
+        frame = timed(
+            timings, "highlight", _apply_lut_in_space,
+            frame, plan["lab_lut"], cv2.COLOR_RGB2LAB, cv2.COLOR_LAB2RGB, source, dst,
+        )
+    if plan["highlight_lut"] is not None:
+        frame = timed(timings, "highlight", _apply_lut, frame, plan["highlight_lut"], source, dst)
+    return frame
+
+
+class FrameWorkspace:
+    """Buffers that fix_frame reuses from one frame to the next instead of allocating new arrays.
+
+    A buffer is (re)allocated only when the resolution changes. The frame returned by
+    fix_frame(..., workspace=...) lives in the workspace, so it is overwritten by the next call.
+    Use one workspace per thread / process.
+    """
+
+    def __init__(self):
+        self.buffers = {}
+
+    def buffer(self, name: str, shape, dtype=np.uint8) -> np.ndarray:
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = self.buffers[name] = np.empty(shape, dtype=dtype)
+        return buffer
+
+
+def _no_buffer(name, shape):
+    return None
+
+
+# ============= STRIPS ==============================
+# fix_frame(..., strips=n) runs sharpen + the colour plan on n horizontal strips in a thread pool
+# (cv2 releases the GIL). Each strip is blurred with `halo` extra rows on both sides, which
+# covers the Gaussian kernel, so the stitched frame is identical to the whole-frame result.
+
+
+@lru_cache(maxsize=None)
+def _strip_pool(strips: int) -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=strips, thread_name_prefix="fix_frame_strip")
+
+
+# a forked process (the parallel_processing workers) inherits the pools but not their threads
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_strip_pool.cache_clear)
+
+
+def strip_halo(sigma: float) -> int:
+    # OpenCV sizes a uint8 Gaussian kernel as 6 sigma + 1, radius 3 sigma; one row to spare
+    return int(np.ceil(3 * sigma)) + 1
+
+
+def _sharpen_and_colour_strip(frame, dst, y0, y1, halo, sharpen, sharpen_percentage, sigma, plan):
+    top, bottom = max(y0 - halo, 0), min(y1 + halo, frame.shape[0])
+    sharpened = sharpen(frame[top:bottom], percentage=sharpen_percentage, sigma=sigma)
+    strip = sharpened[y0 - top : y1 - top]
+    out = dst[y0:y1]
+    coloured = apply_colour_plan(strip, plan, dst=out)
+    if coloured is not out:  # no colour stage ran, or OpenCV could not write into the view
+        out[...] = coloured
+
+
+def sharpen_and_colour_in_strips(frame, sharpen_percentage, sigma, plan, strips, dst=None, sharpen=sharpen_image):
+    dst = np.empty_like(frame) if dst is None else dst
+    bounds = np.linspace(0, frame.shape[0], strips + 1).astype(int)
+    halo = strip_halo(sigma) if sharpen_percentage != 0 else 0
+    futures = [
+        _strip_pool(strips).submit(
+            _sharpen_and_colour_strip, frame, dst, y0, y1, halo, sharpen, sharpen_percentage, sigma, plan
+        )
+        for y0, y1 in zip(bounds[:-1], bounds[1:])
+        if y1 > y0
+    ]
+    for future in futures:
+        future.result()
+    return dst
+
+
+# ============= BACKENDS ==============================
+# fix_frame(..., backend=...) picks where the filter chain runs:
+#   "numpy": cv2 on ndarrays, with the workspace buffers and strips (the default, bit-exact)
+#   "umat":  cv2's transparent API on cv2.UMat, i.e. OpenCL when OpenCV finds a device. Without
+#            one it runs the CPU code, correct but with copying overhead. Workspaces and strips
+#            do not apply, and OpenCL kernels may round differently by a level.
+#   "auto":  the fastest for this resolution and parameter set, timed once with select_backend
+#            and remembered. numpy stays unless another backend is clearly (BACKEND_MARGIN) faster.
+# Nothing is set up at import; OpenCL is switched on the first time the umat backend runs.
+
+BACKENDS = ("numpy", "umat")
+AUTO_BACKEND = "auto"
+BACKEND_TRIALS = 3
+BACKEND_MARGIN = 0.9
+BACKEND_CHOICES = 64  # remembered (resolution, params) selections before starting over
+
+_backend_choices: dict = {}
+
+
+@lru_cache(maxsize=None)
+def opencl_enabled() -> bool:
+    available = cv2.ocl.haveOpenCL()
+    cv2.ocl.setUseOpenCL(available)
+    return available
+
+
+def select_backend(frame: np.ndarray, params: dict) -> str:
+    """The fastest of BACKENDS for fix_frame(frame, **params), timed on `frame` once."""
+    key = (frame.shape, tuple(sorted(params.items())))
+    choice = _backend_choices.get(key)
+    if choice is None:
+        seconds = {}
+        for backend in BACKENDS:
+            fix_frame(frame, **params, backend=backend)  # warm up: colour plans, OpenCL kernel builds
+            start = time.perf_counter()
+            for _ in range(BACKEND_TRIALS):
+                fix_frame(frame, **params, backend=backend)
+            seconds[backend] = (time.perf_counter() - start) / BACKEND_TRIALS
+        choice = min(seconds, key=seconds.get)
+        if seconds[choice] > seconds["numpy"] * BACKEND_MARGIN:
+            choice = "numpy"
+        print(
+            f"fix_frame backend for {frame.shape[1]}x{frame.shape[0]}: {choice} ("
+            + ", ".join(f"{backend} {value * 1000:.1f}ms" for backend, value in seconds.items()) + ")"
+        )
+        if len(_backend_choices) >= BACKEND_CHOICES:
+            _backend_choices.clear()
+        _backend_choices[key] = choice
+    return choice
+
+
+def resolve_backend(frame: np.ndarray, params: dict) -> dict:
+    """`params` (fix_frame keyword arguments) with an "auto" backend replaced by the chosen one."""
+    if params.get("backend") != AUTO_BACKEND:
+        return params
+    fixed_params = {name: value for name, value in params.items() if name != "backend"}
+    return {**fixed_params, "backend": select_backend(frame, fixed_params)}
+
+
+def _shared_stage(shared, key, compute):
+    # with a `shared` dict (one per source frame), a stage already computed for another variant
+    # with the same parameters so far is reused instead of recomputed
+    if shared is None:
+        return compute()
+    if key not in shared:
+        shared[key] = compute()
+    return shared[key]
+
 
 def fix_frame(
     frame,
@@ -125,21 +423,109 @@ def fix_frame(
     shift_x=0,
     shift_y=0,
     max_frames=10000000,
+    interpolation="linear",
+    colour_at_output=False,
+    strips=1,
+    accurate=True,
+    backend="numpy",
+    sharpen_sigma=3.0,
+    timings=None,
+    workspace=None,
+    shared=None,
 ):
-    frame = shift_frame(frame, shift_x, shift_y)
-    frame = zoom(frame, percentage=zoom_percentage)
-    frame = sharpen_image(frame, percentage=sharpen_percentage)
-    frame = adjust_contrast(frame, percentage=contrast_percentage)
-    frame = adjust_saturation(frame, percentage=saturation_percentage)
-    if shadow_percentage != 0:
-        frame = add_shadow(frame, shadow_percentage)
-    if highlight_percentage != 0:
-        frame = add_highlight(frame, highlight_percentage)
-    if width != 0 and height != 0:
-        frame = resize_frame(frame, width=width, height=height)
+    # timings: optional dict that collects the seconds spent in each stage (see profiling.py)
+    # colour_at_output: when the output is smaller than the zoomed crop, resample first and run
+    # sharpen / colour on the output pixels. Much cheaper for 4K -> 1080p, but not bit-identical:
+    # the curves do not commute with interpolation (exact with interpolation="nearest").
+    # strips: run sharpen + colour on this many horizontal strips in parallel threads (exact).
+    # accurate=False: luma-only integer unsharp mask (sharpen_luma) instead of per-channel
+    # sharpening. Faster; the detail is the same on all three channels, up to ±20 levels at 30%.
+    # backend: "numpy", "umat" or "auto" (see BACKENDS above)
+    # sharpen_sigma: the unsharp mask blur in pixels of `frame` (a downscaled preview scales it too)
+    # shared: see fix_frame_variants
+    if backend == AUTO_BACKEND:
+        params = {
+            name: value for name, value in locals().items()
+            if name not in ("frame", "backend", "timings", "workspace", "shared")
+        }
+        backend = select_backend(frame, params)
+    upload = None
+    if backend == "umat":
+        opencl_enabled()
+        upload = cv2.UMat
+        workspace, strips = None, 1
+    x1, y1, x2, y2 = zoom_box(frame.shape, zoom_percentage)
+    crop_size = (x2 - x1, y2 - y1)
+    output_size = (width, height) if width != 0 and height != 0 else crop_size
+    downscale = output_size[0] * output_size[1] < crop_size[0] * crop_size[1]
+    buffer = workspace.buffer if workspace is not None else _no_buffer
+
+    if colour_at_output and downscale:
+        work_size = output_size
+        sigma = sharpen_sigma * output_size[0] / crop_size[0]
+    else:
+        work_size = crop_size
+        sigma = sharpen_sigma
+    work_shape = (work_size[1], work_size[0], 3)
+    # every stage's key holds the parameters of the chain up to and including it
+    geometry = (backend, shift_x, shift_y, zoom_percentage, work_size, interpolation)
+    sharpening = (*geometry, sharpen_percentage, sigma, accurate)
+    colouring = (*sharpening, contrast_percentage, saturation_percentage, shadow_percentage, highlight_percentage)
+    frame = _shared_stage(shared, geometry, lambda: timed(
+        timings, "geometry", transform_geometry,
+        frame, shift_x, shift_y, zoom_percentage, work_size, interpolation,
+        dst=buffer("geometry", work_shape), upload=upload,
+    ))
+    plan = build_colour_plan(
+        contrast_percentage, saturation_percentage, shadow_percentage, highlight_percentage
+    )
+    sharpen = sharpen_image if accurate else sharpen_luma
+    if strips > 1:
+        frame = _shared_stage(shared, colouring, lambda: timed(
+            timings, "strips", sharpen_and_colour_in_strips,
+            frame, sharpen_percentage, sigma, plan, strips, dst=buffer("colour", work_shape), sharpen=sharpen,
+        ))
+    else:
+        if accurate:
+            frame = _shared_stage(shared, sharpening, lambda: timed(
+                timings, "sharpen", sharpen_image, frame, percentage=sharpen_percentage, sigma=sigma,
+                dst=buffer("sharpen", work_shape), blur_dst=buffer("blur", work_shape),
+            ))
+        else:
+            frame = _shared_stage(shared, sharpening, lambda: timed(
+                timings, "sharpen", sharpen_luma, frame, percentage=sharpen_percentage, sigma=sigma,
+                dst=buffer("sharpen", work_shape),
+            ))
+        frame = _shared_stage(
+            shared, colouring, lambda: apply_colour_plan(frame, plan, timings, dst=buffer("colour", work_shape))
+        )
+    frame = _shared_stage(shared, (*colouring, output_size), lambda: timed(
+        timings, "resize", resize_frame, frame, *output_size, interpolation=interpolation,
+        dst=buffer("output", (output_size[1], output_size[0], 3)), source_size=work_size,
+    ))
+    if upload is not None:
+        # UMat calls are queued, so this stage also waits for the ones before it to finish
+        frame = timed(timings, "download", frame.get)
     return frame
 
 
+def fix_frame_variants(frame, variants, timings=None, workspaces=None):
+    """fix_frame(frame, **params) for every params dict in `variants`, as a list.
+
+    The stages the variants have in common (same parameters up to that point, e.g. the geometry
+    and colour of a 4K and a 1080p deliverable) are computed once. With `workspaces` (one per
+    variant) the outputs live in those workspaces, as with fix_frame.
+    """
+    shared = {}
+    return [
+        fix_frame(
+            frame, **params, timings=timings, shared=shared,
+            workspace=workspaces[number] if workspaces is not None else None,
+        )
+        for number, params in enumerate(variants)
+    ]
+
+
 #  ============= DOCS .... ==============================
 
 """
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Every target directory keeps a manifest of the outputs it holds: which source file (size,
+# mtime, quick hash) they were made from, with which settings and tool versions. A rerun skips
+# outputs whose record still matches and redoes the rest. Outputs are written under a
+# ".partial" name and renamed when complete, so a crash never leaves a half file that looks done.
+
+MANIFEST_NAME = ".video_manifest.json"
+PARTIAL_MARKER = ".partial"
+HASH_CHUNK = 1024 * 1024
+
+
+def quick_hash(path) -> str:
+    # first and last MiB plus the size; enough to tell a re-export from a touched file
+    digest = hashlib.sha1(str(os.path.getsize(path)).encode())
+    with open(path, "rb") as source_file:
+        digest.update(source_file.read(HASH_CHUNK))
+        source_file.seek(max(os.path.getsize(path) - HASH_CHUNK, 0))
+        digest.update(source_file.read(HASH_CHUNK))
+    return digest.hexdigest()
+
+
+def source_identity(path, with_hash=True) -> dict:
+    stat = os.stat(path)
+    identity = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        identity["hash"] = quick_hash(path)
+    return identity
+
+
+@lru_cache(maxsize=1)
+def tool_versions() -> dict:
+    try:
+        ffmpeg = subprocess.run(["ffmpeg", "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        ffmpeg_version = ffmpeg.stdout.splitlines()[0] if ffmpeg.stdout else "unknown"
+    except OSError:
+        ffmpeg_version = "missing"
+    return {"opencv": cv2.__version__, "numpy": np.__version__, "ffmpeg": ffmpeg_version}
+
+
+def partial_path(output_path) -> str:
+    output_path = Path(output_path)
+    return str(output_path.with_name(f"{output_path.stem}{PARTIAL_MARKER}{output_path.suffix}"))
+
+
+def remove_partial_outputs(target_path):
+    for leftover in Path(target_path).glob(f"*{PARTIAL_MARKER}.*"):
+        print(f"Removing incomplete output {leftover}")
+        if leftover.is_dir():  # encoder tuning samples (see compression.tune_encoder)
+            shutil.rmtree(leftover)
+        else:
+            leftover.unlink()
+
+
+class Manifest:
+    """The manifest of one target directory; `record` saves it straight away."""
+
+    def __init__(self, target_path):
+        self.path = Path(target_path) / MANIFEST_NAME
+        self.lock = threading.Lock()
+        self.entries = {}
+        if self.path.exists():
+            try:
+                self.entries = json.loads(self.path.read_text())
+            except ValueError:
+                print(f"Ignoring unreadable manifest {self.path}")
+
+    def is_up_to_date(self, source_path, output_path, settings: dict) -> bool:
+        entry = self.entries.get(Path(output_path).name)
+        if entry is None or entry["settings"] != settings or entry["tools"] != tool_versions():
+            return False
+        if not os.path.exists(output_path) or os.path.getsize(output_path) != entry["output_size"]:
+            return False
+        identity = source_identity(source_path, with_hash=False)
+        recorded = entry["source"]
+        if identity["size"] != recorded["size"]:
+            return False
+        # same size and mtime is trusted; a changed mtime alone is checked against the hash
+        return identity["mtime_ns"] == recorded["mtime_ns"] or quick_hash(source_path) == recorded["hash"]
+
+    def record(self, source_path, output_path, settings: dict, encoder=None):
+        entry = {
+            "source_file": str(source_path),
+            "source": source_identity(source_path),
+            "settings": settings,
+            "encoder": encoder,  # the encoder settings actually used (a tuned profile differs per file)
+            "tools": tool_versions(),
+            "output_size": os.path.getsize(output_path),
+        }
+        with self.lock:
+            self.entries[Path(output_path).name] = entry
+            self.save()
+
+    def save(self):
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        temp_path.write_text(json.dumps(self.entries, indent=2, sort_keys=True))
+        os.replace(temp_path, self.path)
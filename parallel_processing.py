@@ -0,0 +1,165 @@
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from tqdm import tqdm
+
+from image_editing_functions import fix_frame_variants, FrameWorkspace
+from profiling import timed
+
+# Frames travel between the decoder, the workers and the writer through a fixed pool of
+# shared-memory slots: the decoder copies a frame into a free slot, a worker runs fix_frame
+# on it and writes the result into the matching output slot, and the writer hands the slot
+# back once the frame is written. The slot pool bounds memory, and only slot numbers are pickled.
+# With several output variants (see fix_frame_variants) every slot has one output per variant.
+
+_worker_state = {}
+
+
+def _attach_shared_frames(in_name, in_shape, out_names, out_shapes, slots, variants, profiling):
+    in_shm = shared_memory.SharedMemory(name=in_name)
+    out_shms = [shared_memory.SharedMemory(name=out_name) for out_name in out_names]
+    _worker_state.update(
+        in_shm=in_shm,
+        out_shms=out_shms,
+        in_frames=np.ndarray((slots, *in_shape), dtype=np.uint8, buffer=in_shm.buf),
+        out_frames=[
+            np.ndarray((slots, *out_shape), dtype=np.uint8, buffer=out_shm.buf)
+            for out_shm, out_shape in zip(out_shms, out_shapes)
+        ],
+        variants=variants,
+        profiling=profiling,
+        workspaces=[FrameWorkspace() for _ in variants],
+    )
+
+
+def _fix_shared_frame(slot: int):
+    # returns the stage timings of the frame when profiling, else None
+    timings = {} if _worker_state["profiling"] else None
+    outputs = fix_frame_variants(
+        _worker_state["in_frames"][slot], _worker_state["variants"],
+        timings=timings, workspaces=_worker_state["workspaces"],
+    )
+    for out_frames, fixed in zip(_worker_state["out_frames"], outputs):
+        out_frames[slot] = fixed
+    return timings
+
+
+def _write(outs, frames, timings, profile):
+    for out, frame in zip(outs, frames):
+        timed(timings, "write", out.write, frame)
+    if profile is not None:
+        profile.record_frame(timings)
+
+
+def _decode_into_slots(frames, in_frames, free_slots, pending, submit, abort, should_stop, detector=None):
+    try:
+        for frame in frames:
+            if should_stop() or abort.is_set():
+                break
+            if detector is not None and detector.is_static(frame):
+                pending.put((None, None))  # the writer repeats the previous output
+                continue
+            slot = None
+            while slot is None and not abort.is_set():
+                try:
+                    slot = free_slots.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            if slot is None:
+                break
+            in_frames[slot] = frame
+            pending.put((slot, submit(slot)))
+    finally:
+        pending.put(None)
+
+
+def process_frames_parallel(
+    frames, out, params, n_frames, workers=None, slots=None, should_stop=lambda: False, profile=None,
+    detector=None,
+):
+    """Run fix_frame on `workers` processes and write the frames to `out` in source order.
+
+    `frames` is an iterator of decoded frames, consumed on the decoder thread; the first one
+    sets the slot sizes. `out` and `params` can also be lists (one writer per params dict), in
+    which case every frame is rendered with fix_frame_variants and written to each writer.
+    `profile` is an optional profiling.FileProfile that receives the stage timings of every
+    frame. With a temporal.StaticFrameDetector, static frames are not sent to the workers and
+    the previous output is written again. Returns the number of frames written.
+    """
+    outs = out if isinstance(out, list) else [out]
+    variants = params if isinstance(params, list) else [params]
+    workers = workers or os.cpu_count() or 1
+    slots = max(slots or 2 * workers, 2)  # the writer holds one slot back
+    first_frame = next(frames, None)
+    if first_frame is None:
+        return 0
+    timings = {} if profile is not None else None
+    if detector is not None:
+        detector.is_static(first_frame)
+    first_fixed = fix_frame_variants(first_frame, variants, timings=timings)
+    _write(outs, first_fixed, timings, profile)
+    in_shape, out_shapes = first_frame.shape, [fixed.shape for fixed in first_fixed]
+
+    in_shm = shared_memory.SharedMemory(create=True, size=slots * first_frame.nbytes)
+    out_shms = [shared_memory.SharedMemory(create=True, size=slots * fixed.nbytes) for fixed in first_fixed]
+    in_frames = np.ndarray((slots, *in_shape), dtype=np.uint8, buffer=in_shm.buf)
+    out_frames = [
+        np.ndarray((slots, *out_shape), dtype=np.uint8, buffer=out_shm.buf)
+        for out_shm, out_shape in zip(out_shms, out_shapes)
+    ]
+
+    free_slots: queue.Queue = queue.Queue()
+    for slot in range(slots):
+        free_slots.put(slot)
+    pending: queue.Queue = queue.Queue()  # bounded by the slot pool
+    abort = threading.Event()
+    written = 1
+    # the last written slot is held back while static frames may still repeat it
+    previous, previous_slot, current = first_fixed, None, None
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_attach_shared_frames,
+            initargs=(
+                in_shm.name, in_shape, [out_shm.name for out_shm in out_shms], out_shapes,
+                slots, variants, profile is not None,
+            ),
+        ) as pool:
+            decoder = threading.Thread(
+                target=_decode_into_slots,
+                args=(
+                    frames, in_frames, free_slots, pending,
+                    lambda slot: pool.submit(_fix_shared_frame, slot), abort, should_stop, detector,
+                ),
+                daemon=True,
+            )
+            decoder.start()
+            try:
+                # pending holds the futures in decode order, so waiting on them in turn
+                # reassembles the frames by index whatever order the workers finish in
+                with tqdm(total=n_frames, initial=1, desc="Loading Frames") as bar:
+                    while (item := pending.get()) is not None:
+                        slot, future = item
+                        if slot is None:
+                            _write(outs, previous, {} if profile is not None else None, profile)
+                        else:
+                            current = [frames_of_variant[slot] for frames_of_variant in out_frames]
+                            _write(outs, current, future.result(), profile)
+                            if previous_slot is not None:
+                                free_slots.put(previous_slot)
+                            previous, previous_slot = current, slot
+                        written += 1
+                        bar.update()
+            finally:
+                abort.set()
+                decoder.join()
+    finally:
+        del in_frames, out_frames, previous, current  # views into the shared memory
+        for shm in (in_shm, *out_shms):
+            shm.close()
+            shm.unlink()
+    return written
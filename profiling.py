@@ -0,0 +1,104 @@
+import csv
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Opt-in per-stage timing. Code paths take an optional `timings` dict (one per frame) and wrap
+# each stage with `timed`; when profiling is off they get None and `timed` is a plain call.
+
+PERCENTILES = (50, 90, 99)
+
+
+def timed(timings, stage: str, function, *args, **kwargs):
+    if timings is None:
+        return function(*args, **kwargs)
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+    return result
+
+
+class FileProfile:
+    """Per-stage wall times (seconds) for the frames of one file."""
+
+    def __init__(self, file_path):
+        self.file_path = Path(file_path)
+        self.started = time.perf_counter()
+        self.finished = None
+        self.frames = 0
+        self.reused_frames = 0  # static frames that skipped fix_frame (see temporal.py)
+        self.stages: dict = {}
+
+    def record(self, stage: str, seconds: float):
+        self.stages.setdefault(stage, []).append(seconds)
+
+    def record_frame(self, timings: dict):
+        for stage, seconds in timings.items():
+            self.record(stage, seconds)
+        self.frames += 1
+
+    def merge(self, other: "FileProfile"):
+        # timings of a chunk of the same file processed elsewhere (see process_video_chunks)
+        for stage, samples in other.stages.items():
+            self.stages.setdefault(stage, []).extend(samples)
+        self.frames += other.frames
+        self.reused_frames += other.reused_frames
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def fps(self) -> float:
+        return self.frames / max(self.elapsed(), 1e-9)
+
+    def summary(self) -> dict:
+        stages = {}
+        for stage, samples in self.stages.items():
+            samples_ms = np.array(samples) * 1000
+            stages[stage] = {
+                "count": len(samples),
+                "total_ms": float(samples_ms.sum()),
+                "mean_ms": float(samples_ms.mean()),
+                **{f"p{p}_ms": float(np.percentile(samples_ms, p)) for p in PERCENTILES},
+                "max_ms": float(samples_ms.max()),
+            }
+        return {
+            "file": str(self.file_path),
+            "frames": self.frames,
+            "reused_frames": self.reused_frames,
+            "seconds": self.elapsed(),
+            "fps": self.fps(),
+            "stages": stages,
+        }
+
+    def live_text(self) -> str:
+        means = " | ".join(
+            f"{stage} {np.mean(samples[-100:]) * 1000:.1f}ms"
+            for stage, samples in list(self.stages.items())
+            if stage != "encode"
+        )
+        return f"{self.file_path.name}: {self.fps():.1f} fps\n{means}"
+
+
+def write_report(profiles, report_path):
+    # .csv gives one row per file and stage, anything else is written as JSON
+    summaries = [profile.summary() for profile in profiles]
+    report_path = Path(report_path)
+    if report_path.suffix.lower() == ".csv":
+        columns = ["count", "total_ms", "mean_ms", *[f"p{p}_ms" for p in PERCENTILES], "max_ms"]
+        with open(report_path, "w", newline="") as report_file:
+            writer = csv.writer(report_file)
+            writer.writerow(["file", "frames", "reused_frames", "fps", "stage", *columns])
+            for summary in summaries:
+                for stage, stats in summary["stages"].items():
+                    writer.writerow(
+                        [summary["file"], summary["frames"], summary["reused_frames"], f"{summary['fps']:.3f}", stage]
+                        + [f"{stats[column]:.3f}" if column != "count" else stats[column] for column in columns]
+                    )
+    else:
+        with open(report_path, "w") as report_file:
+            json.dump(summaries, report_file, indent=2)
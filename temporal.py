@@ -0,0 +1,43 @@
+import cv2
+
+# Screen captures and static-camera recordings repeat the same frame for long stretches. A frame
+# whose block means (BLOCK x BLOCK averages) all stay within `threshold` levels of the last
+# processed frame is not run through fix_frame again; the previous output is written instead.
+# Comparing against the last *processed* frame, not the previous one, keeps slow drifts from
+# accumulating unnoticed. Block means average sensor noise away but still catch a moving cursor.
+
+BLOCK = 16
+STATIC_THRESHOLD = 2
+
+
+class StaticFrameDetector:
+    """Decides per source frame (in order) whether the last processed output can be reused."""
+
+    def __init__(self, threshold=STATIC_THRESHOLD, block=BLOCK):
+        self.threshold = threshold
+        self.block = block
+        self.reference = None
+        self.reused = 0
+        self.processed = 0
+
+    def signature(self, frame):
+        height, width = frame.shape[:2]
+        size = (max(width // self.block, 1), max(height // self.block, 1))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    def is_static(self, frame) -> bool:
+        signature = self.signature(frame)
+        if (
+            self.reference is not None
+            and signature.shape == self.reference.shape
+            and cv2.absdiff(signature, self.reference).max() <= self.threshold
+        ):
+            self.reused += 1
+            return True
+        self.reference = signature
+        self.processed += 1
+        return False
+
+    def summary(self) -> str:
+        total = self.reused + self.processed
+        return f"{self.reused} of {total} frames reused as static ({self.reused / max(total, 1):.0%})"
@@ -3,16 +3,37 @@ from PIL import Image  # type: ignore
 from customtkinter import CTkImage
 import cv2
 import builtins
+import os
+import threading
+import time
+from functools import partial
 from pathlib import Path
-from image_editing_functions import fix_frame
+from image_editing_functions import fix_frame, zoom_box
+from cache import file_key, frame_cache, params_key, probe_cache
+from frame_index import indexed_frame, timeline_frame, warm_index
+
+PANEL_PADDING = 20
+PREVIEW_STRIPS = os.cpu_count() or 1
+
+
+def fit_size(frame_w, frame_h, panel_w, panel_h):
+    ratio = frame_w / frame_h
+    new_w = int(panel_h * ratio) if panel_h * ratio <= panel_w else panel_w
+    new_h = int(new_w / ratio)
+    return max(new_w, 1), max(new_h, 1)
+
+
+def panel_size(right_frame):
+    return (
+        max(right_frame.winfo_width() - PANEL_PADDING, 1),
+        max(right_frame.winfo_height() - PANEL_PADDING, 1),
+    )
 
 
 def on_right_frame_resize(event, original_frame):
     # Recalculate and resize the image based on the new dimensions of right_frame
-    w, h = event.width - 20, event.height - 20  # Subtracting padding
-    ratio = original_frame.shape[1] / original_frame.shape[0]
-    new_w = int(h * ratio) if h * ratio <= w else w
-    new_h = int(new_w / ratio)
+    w, h = event.width - PANEL_PADDING, event.height - PANEL_PADDING  # Subtracting padding
+    new_w, new_h = fit_size(original_frame.shape[1], original_frame.shape[0], w, h)
 
     # Resize and update the displayed image
     ctk_image = CTkImage(Image.fromarray(original_frame), size=(new_w, new_h))
@@ -20,19 +41,23 @@ def on_right_frame_resize(event, original_frame):
 
 
 def display_frame(frame, right_frame):
-    if hasattr(builtins, "image"):
-        builtins.image.destroy()
     frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
     h, w, _ = frame.shape
-    ratio = w / h
-    new_w = int(right_frame.winfo_width())
-    new_h = int(new_w / ratio)
+    new_w, new_h = fit_size(w, h, *panel_size(right_frame))
+    if w > new_w:
+        frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_AREA)
     ctk_image = CTkImage(Image.fromarray(frame), size=(new_w, new_h))
-
-    builtins.image = ctk.CTkLabel(right_frame, image=ctk_image, text="")
-    builtins.image.pack(padx=10, pady=10, fill=ctk.BOTH, expand=True)
-
-    right_frame.bind("<Configure>", lambda event: on_right_frame_resize(event, frame))
+    builtins.displayed_frame = frame
+
+    # the label is created once and then updated in place
+    if not hasattr(builtins, "image"):
+        builtins.image = ctk.CTkLabel(right_frame, image=ctk_image, text="")
+        builtins.image.pack(padx=10, pady=10, fill=ctk.BOTH, expand=True)
+        right_frame.bind(
+            "<Configure>", lambda event: on_right_frame_resize(event, builtins.displayed_frame)
+        )
+    else:
+        builtins.image.configure(image=ctk_image)
     return frame
 
 
@@ -126,34 +151,210 @@ def get_params_from_ui():
     return params, width, height
 
 
+def reference_file():
+    # the directory listing is cached until the directory changes
+    source_path = Path(builtins.source_path_entry.get())
+    if not source_path.is_dir():
+        return None
+    file_paths = probe_cache.get_or_compute(
+        ("listing", str(source_path.resolve()), source_path.stat().st_mtime_ns),
+        lambda: tuple(source_path.glob("*.*")),
+    )
+    return file_paths[0] if file_paths else None
+
+
+def reference_frame(file_path, position):
+    # (frame, source key) at `position` % of the file. Slow the first time (index scan, seek
+    # and decode), so PreviewRenderer calls it on its worker thread, never on the Tk one.
+    # Decoded frames are cached by file identity, so refreshes and button presses don't re-decode
+    frame_number = timeline_frame(file_path, position)
+    if frame_number == 0:
+        warm_index(file_path)
+    frame = indexed_frame(file_path, frame_number)
+    return frame, (file_key(file_path), frame_number)
+
+
+def timeline_position() -> float:
+    if not hasattr(builtins, "timeline_slider"):
+        return 0.0
+    return float(builtins.timeline_slider[0].get())
+
+
+def proxy_frame(frame, panel, source_key=None, zoom_percentage=0):
+    # A copy of the reference frame downscaled so that its zoomed crop still covers the preview
+    # panel, so the preview runs fix_frame on a fraction of the pixels of a 4K source
+    h, w, _ = frame.shape
+    x1, y1, x2, y2 = zoom_box(frame.shape, zoom_percentage)
+    panel_w, panel_h = panel
+    scale = min(1.0, max(panel_w / max(x2 - x1, 1), panel_h / max(y2 - y1, 1)))
+    size = (max(int(w * scale), 1), max(int(h * scale), 1))
+    if scale >= 1:
+        return frame, scale
+
+    def resize():
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    if source_key is None:
+        return resize(), scale
+    return frame_cache.get_or_compute(("proxy", source_key, size), resize), scale
+
+
+def preview_params(params, scale, source_size, panel):
+    width, height = params["width"], params["height"]
+    if width == 0 or height == 0:
+        width, height = source_size
+    preview_width, preview_height = fit_size(width, height, *panel)
+    return {
+        **params,
+        "shift_x": params["shift_x"] * scale,
+        "shift_y": params["shift_y"] * scale,
+        "sharpen_sigma": params.get("sharpen_sigma", 3.0) * scale,
+        "width": preview_width,
+        "height": preview_height,
+        "strips": PREVIEW_STRIPS,  # one frame at a time, so spread it over the cores
+    }
+
+
 def load_first_frame(frame=None):
-    ret = True
+    # without a frame, shows the unprocessed reference frame (the Original Frame button)
     if frame is None:
-        file_paths = list(Path(builtins.source_path_entry.get()).glob("*.*"))
-        video_capture = cv2.VideoCapture(str(file_paths[0]))
-        ret, frame = video_capture.read()
-    if ret:
-        display_frame(frame, builtins.right_frame)
-    return ret, frame
+        request_preview(None)
+        return
+    display_frame(frame, builtins.right_frame)
+
+
+def render_preview(frame, params, panel, is_stale=lambda: False, source_key=None):
+    # returns None when a newer request arrived between two stages
+    timings = {}
+    output_key = None
+    if source_key is not None:
+        # rendered previews are cached, so going back to earlier settings is instant
+        output_key = ("preview", source_key, panel, params_key(params))
+        cached = frame_cache.get(output_key)
+        if cached is not None:
+            timings["cached"] = 0.0
+            return cached, timings
+    start = time.perf_counter()
+    proxy, scale = proxy_frame(frame, panel, source_key, params["zoom_percentage"])
+    timings["proxy"] = time.perf_counter() - start
+    if is_stale():
+        return None, timings
+    start = time.perf_counter()
+    fixed = fix_frame(proxy, **preview_params(params, scale, (frame.shape[1], frame.shape[0]), panel))
+    timings["fix_frame"] = time.perf_counter() - start
+    if output_key is not None:
+        frame_cache.put(output_key, fixed)
+    return fixed, timings
+
+
+def show_rendered_preview(fixed, timings):
+    start = time.perf_counter()
+    load_first_frame(fixed)
+    timings["display"] = time.perf_counter() - start
+    if hasattr(builtins, "preview_message"):
+        builtins.preview_message.configure(
+            text=" | ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in timings.items())
+        )
+
+
+class PreviewRenderer:
+    """Renders the preview on a worker thread, off the Tk event loop.
+
+    Requests go into a single-slot mailbox: a newer request replaces an older one that has
+    not started, and a render that is overtaken is dropped at the next stage boundary.
+    Results are handed back to Tk with root.after.
+    """
+
+    def __init__(self, root, debounce=0.05):
+        self.root = root
+        self.debounce = debounce
+        self.condition = threading.Condition()
+        self.request = None
+        self.generation = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, file_path, position, params, panel):
+        # params None shows the frame unprocessed
+        with self.condition:
+            self.generation += 1
+            self.request = (self.generation, file_path, position, params, panel)
+            self.condition.notify()
+
+    def _next_request(self):
+        with self.condition:
+            while self.request is None:
+                self.condition.wait()
+            # debounce: wait until the requests stop coming in
+            generation = None
+            while generation != self.generation:
+                generation = self.generation
+                self.condition.wait(self.debounce)
+            request, self.request = self.request, None
+            return request
+
+    def _is_stale(self, generation):
+        return generation != self.generation
+
+    def _deliver(self, generation, fixed, timings):
+        if not self._is_stale(generation):
+            show_rendered_preview(fixed, timings)
+
+    def _run(self):
+        while True:
+            generation, file_path, position, params, panel = self._next_request()
+            try:
+                fixed, timings = render_reference(
+                    file_path, position, params, panel, is_stale=partial(self._is_stale, generation)
+                )
+            except Exception as error:
+                print("Preview failed:", error)
+                continue
+            if fixed is not None and not self._is_stale(generation):
+                self.root.after(0, self._deliver, generation, fixed, timings)
+
+
+def render_reference(file_path, position, params, panel, is_stale=lambda: False):
+    # the frame at `position` of `file_path`, rendered with `params` (as it is when params is None)
+    start = time.perf_counter()
+    frame, source_key = reference_frame(file_path, position)
+    seek = time.perf_counter() - start
+    if frame is None or is_stale():
+        return None, {}
+    if params is None:
+        return frame, {"seek": seek}
+    fixed, timings = render_preview(frame, params, panel, is_stale=is_stale, source_key=source_key)
+    return fixed, {"seek": seek, **timings}
+
+
+def request_preview(params):
+    file_path = reference_file()
+    if file_path is None:
+        return
+    panel = panel_size(builtins.right_frame)
+    if hasattr(builtins, "preview_renderer"):
+        builtins.preview_renderer.submit(file_path, timeline_position(), params, panel)
+    else:
+        fixed, timings = render_reference(file_path, timeline_position(), params, panel)
+        if fixed is not None:
+            show_rendered_preview(fixed, timings)
 
 
 def update_loaded_frame():
-    ret, frame = load_first_frame()
-    if ret:
-        params, width, height = get_params_from_ui()
-        fixed = fix_frame(frame, **params)
-        load_first_frame(fixed)
+    params, width, height = get_params_from_ui()
+    request_preview(params)
 
 
 def update_frame_loading_on_params_change():
     params, width, height = get_params_from_ui()
+    # a timeline move also needs a new preview, so the position is part of the compared state
+    state = str((params, timeline_position()))
     if not hasattr(builtins, "original_params"):
-        builtins.original_params = str(params)
+        builtins.original_params = state
         return
 
-    if str(params) != builtins.original_params:
+    if state != builtins.original_params:
         update_loaded_frame()
-        builtins.original_params = str(params)
+        builtins.original_params = state
 
 
 def center_window(root, width=400, height=450):
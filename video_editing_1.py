@@ -1,98 +1,322 @@
 from pathlib import Path
+import argparse
 import cv2
+import itertools
+import json
+import multiprocessing
+import numpy as np
 import os
+import time
 import builtins
 from tqdm import tqdm
-from image_editing_functions import fix_frame
-from compression import compress_with_ffmpeg
-import customtkinter as ctk  # type: ignore
+from image_editing_functions import fix_frame, fix_frame_variants, resolve_backend, FrameWorkspace, AUTO_BACKEND
+from compression import FFmpegWriter, concat_segments, keyframe_times, encoder_settings, tune_encoder, AUTO_PROFILE, ENCODING_PROFILES, JsonProgressLog
+from parallel_processing import process_frames_parallel
+from batch_scheduler import run_batch, batch_summary, new_job, FAILED, SKIPPED
+from profiling import FileProfile, timed, write_report
+from cache import cached_frame, probe_video
+from manifest import Manifest, partial_path, remove_partial_outputs
+from temporal import StaticFrameDetector
+from watch import watched_files, POLL_SECONDS, SETTLE_SECONDS
+import queue
 import threading
-from tqdm.contrib.concurrent import process_map  # type: ignore
-import shutil
+from concurrent.futures import ProcessPoolExecutor, wait
 
-
-from ui_functions import (
-    center_window,
-    create_slider,
-    create_entry_with_label,
-    get_params_from_ui,
-    update_loaded_frame,
-    load_first_frame,
-    update_frame_loading_on_params_change,
-)
+# customtkinter and ui_functions are only imported by the GUI functions, so the batch path
+# (process_directory / the command line) runs on machines without Tk.
 
 # custom CONST:
-fourcc = cv2.VideoWriter_fourcc(*"mp4v")  # type: ignore
 DEFAULT_SOURCE = "C:\\Users\\Ben\\Desktop\\before"
 DEFAULT_TARGET = "C:\\Users\\Ben\\Desktop\\after"
 MAX_FRAMES = 100000000
 BITRATE = "4000k"
+ENCODING = "default"  # a compression.ENCODING_PROFILES name, or "auto" to tune per file
+TUNING_SAMPLES = 3  # "auto" encodes this many runs of TUNING_RUN consecutive processed frames
+TUNING_RUN = 10
+WORKERS = os.cpu_count() or 1
+PREFETCH_FRAMES = 8  # decoded frames buffered ahead of the filter stage
+INDEX_BLOCK = 4096  # kept frame numbers are generated this many source frames at a time
+FILTER_JOBS = 1
+ENCODE_JOBS = 1
+
+
+def skip_frame(frame_idx, speed_percentage: float):
+    if speed_percentage <= 0:
+        return np.zeros_like(frame_idx, dtype=bool)  # No skipping if speed is 100%
+
+    # e.g., 30% increase means 1.3 times the original frame rate: output frame k shows source
+    # frame floor(k * 1.3). Work with integer ratios so the spacing is exact and even.
+    numerator, denominator = round((100 + speed_percentage) * 100), 10000
 
+    # frame i is kept if some k has floor(k * ratio) == i, i.e. ceil(i / ratio) * ratio < i + 1
+    frame_idx = np.asarray(frame_idx, dtype=np.int64)
+    k = -(-frame_idx * denominator // numerator)
+    return k * numerator >= (frame_idx + 1) * denominator
 
-def skip_frame(frame_idx: int, speed_percentage: float) -> bool:
-    if speed_percentage == 0:
-        return False  # No skipping if speed is 100%
 
-    # e.g., 30% increase means 1.3 times the original frame rate
-    frame_rate_multiplier = 1 + (speed_percentage / 100)
+def kept_frame_indices(n_frames: int, speed_percentage: float) -> np.ndarray:
+    return np.flatnonzero(~skip_frame(np.arange(n_frames), speed_percentage))
 
-    # Calculate the skip factor, For 130% speed, we want to keep 100/130 of the frames
-    skip_factor = 1 - (1 / frame_rate_multiplier)
 
-    # Now, we skip frames based on the skip factor. We skip a frame if the current index divided by total frames is less than skip factor
-    return (frame_idx % int(1 / skip_factor)) != 0
+def kept_indices(speed_percentage: float, start=0, stop=None):
+    # the kept frame numbers in [start, stop), generated lazily in blocks: the stream decides
+    # where it ends, CAP_PROP_FRAME_COUNT is often wrong (.MOV) and only used as an estimate
+    for block_start in itertools.count(start, INDEX_BLOCK):
+        block_stop = block_start + INDEX_BLOCK if stop is None else min(block_start + INDEX_BLOCK, stop)
+        if block_stop <= block_start:
+            return
+        block = np.arange(block_start, block_stop)
+        yield from block[~skip_frame(block, speed_percentage)].tolist()
+
+
+def planned_frames(video_capture, frame_indices, profile=None, start=0):
+    # dropped frames are only grabbed (demuxed), never decoded to BGR or sent to fix_frame.
+    # `start` is the frame the capture is positioned on (after a seek). Ends with the stream.
+    position = start
+    for frame_idx in frame_indices:
+        decode_start = time.perf_counter()
+        while position < frame_idx:
+            if not video_capture.grab():
+                return
+            position += 1
+        ret, frame = video_capture.read()
+        if not ret:
+            return
+        position += 1
+        if profile is not None:
+            profile.record("decode", time.perf_counter() - decode_start)
+        yield frame
+
+
+def prefetch(frames, size=PREFETCH_FRAMES):
+    """Iterate `frames` on a background thread, keeping up to `size` decoded frames ahead.
+
+    Decoding then overlaps with filtering; errors are re-raised in the consumer. Closing the
+    generator (or dropping it) stops the thread at the next frame.
+    """
+    buffer = queue.Queue(maxsize=size)
+    closed = threading.Event()
+    end = object()
+
+    def hand_over(item) -> bool:
+        # False once the consumer has closed, so a full queue never blocks the thread for good
+        while not closed.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def decode():
+        try:
+            for frame in frames:
+                if not hand_over(frame):
+                    return
+            hand_over(end)
+        except BaseException as error:
+            hand_over(error)
+
+    decoder = threading.Thread(target=decode, daemon=True, name="prefetch")
+    decoder.start()
+    try:
+        while (item := buffer.get()) is not end:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        closed.set()
+        decoder.join()
 
 
 if Path("test/input").exists():
     DEFAULT_SOURCE = "test/input"
     DEFAULT_TARGET = "test/output"
     MAX_FRAMES = 100
+
+# same keys and starting values as get_params_from_ui, plus the fix_frame options it leaves at default
+DEFAULT_SPEED = 30
+DEFAULT_PARAMS = {
+    "width": 3840,
+    "height": 2160,
+    "shift_x": 0.0,
+    "shift_y": 0.0,
+    "zoom_percentage": 40.0,
+    "sharpen_percentage": 0.0,
+    "contrast_percentage": 0.0,
+    "saturation_percentage": 0.0,
+    "shadow_percentage": 0.0,
+    "highlight_percentage": 0.0,
+    "max_frames": MAX_FRAMES,
+    "interpolation": "linear",
+    "colour_at_output": False,
+    "strips": 1,  # >1 splits each frame over threads; for the serial path (filter jobs >= cores)
+    "accurate": True,  # False: faster luma-only sharpening (see fix_frame)
+    "backend": "numpy",  # "umat" (OpenCL) or "auto" (timed once per resolution and params)
+}
 # ==========================   UI     ================================
 # Global flag to check if the script should stop
 stop_script = False
 
 
-def process_video_frame(video_capture, params):
-    ret, frame = video_capture.read()
-    return fix_frame(frame, **params) if ret else None
-
-
-def fix_frame_process(params):
-    frame, params = params
-    return fix_frame(frame, **params)
+def load_preset(preset_path) -> dict:
+    with open(preset_path) as preset_file:
+        return {**DEFAULT_PARAMS, **json.load(preset_file)}
+
+
+def load_variants(variants_path) -> list:
+    with open(variants_path) as variants_file:
+        variants = json.load(variants_file)
+    # a non-empty suffix keeps the name apart from the main output; unique ones (case-insensitively,
+    # for Windows) keep two encoders off the same .partial file
+    if not all(isinstance(variant, dict) and variant.get("suffix") for variant in variants):
+        raise ValueError(f"{variants_path}: every variant needs a non-empty \"suffix\"")
+    suffixes = [variant["suffix"].casefold() for variant in variants]
+    if len(set(suffixes)) != len(suffixes):
+        raise ValueError(f"{variants_path}: every variant needs a different \"suffix\"")
+    return variants
+
+
+def process_directory(
+    source_path,
+    target_path,
+    params=None,
+    speed_percentage=DEFAULT_SPEED,
+    target_bitrate=BITRATE,
+    filter_jobs=FILTER_JOBS,
+    encode_jobs=ENCODE_JOBS,
+    on_update=None,
+    profile_report=None,
+    force=False,
+    chunks=1,
+    encoding=ENCODING,
+    min_psnr=None,
+    on_progress=None,
+    progress_log=None,
+    static_threshold=None,
+    variants=None,
+    file_paths=None,
+):
+    """Process and compress every file in `source_path` into `target_path`; returns the job records.
+
+    With `profile_report` (a .json or .csv path) the per-stage timings of every file are written there.
+    Outputs recorded as up to date in the target's manifest are skipped unless `force` is set.
+    With `chunks` > 1 each file is split into that many keyframe-aligned parts processed side by side.
+    `encoding` names the encoder profile; "auto" tunes CRF/preset per file for `target_bitrate`
+    (or `min_psnr`), and the settings used are recorded in the manifest.
+    Encoder progress events (compression.ProgressEvent) go to `on_progress` and are appended to the
+    `progress_log` JSON lines file.
+    With a `static_threshold` (see temporal.py), frames that hardly differ from the last processed
+    one reuse its output instead of going through fix_frame.
+    `variants` adds more outputs per file from the same decode (see output_variants).
+    `file_paths` replaces the directory listing, e.g. with the endless watch.watched_files.
+    """
+    if variants and chunks > 1:
+        # checked here once, not as a failure of every job
+        raise ValueError("output variants cannot be combined with chunks")
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    width, height = params["width"], params["height"]
+    if file_paths is None:
+        file_paths = list(Path(source_path).glob("*.*"))
+    Path(target_path).mkdir(parents=True, exist_ok=True)
+    remove_partial_outputs(target_path)
+    manifest = Manifest(target_path)
+    settings = {
+        "params": params, "speed_percentage": speed_percentage, "bitrate": target_bitrate,
+        "encoding": encoding, "min_psnr": min_psnr, "static_threshold": static_threshold,
+        "variants": variants,
+    }
+
+    def output_paths(output_path):
+        return [output_path, *(variant_output_path(output_path, variant["suffix"]) for variant in variants or [])]
+
+    skipped = []
+
+    def outdated(file_paths):
+        # checked as the files come in, so this also works on a generator
+        for file_path in file_paths:
+            try:
+                up_to_date = not force and all(
+                    manifest.is_up_to_date(file_path, output_path, settings)
+                    for output_path in output_paths(fix_output_path_name(target_path, file_path))
+                )
+            except OSError as error:  # renamed or deleted since it was listed
+                print(f"Skipping {file_path}: {error}")
+                continue
+            if up_to_date:
+                skipped.append(file_path)
+                continue
+            yield file_path
+
+    profiles = []
+    subscribers = [on_progress] if on_progress is not None else []
+    if progress_log:
+        subscribers.append(JsonProgressLog(progress_log))
+
+    def run_job(file_path, frames_done):
+        print(f"{file_path}: {os.path.getsize(file_path) / 1024000:.3f} MB")
+        profile = None
+        if profile_report:
+            profile = FileProfile(file_path)
+            profiles.append(profile)
+            builtins.active_profile = profile  # live readout in the GUI
+        if encoding == AUTO_PROFILE:
+            encoder = tuned_encoder(file_path, file_backend(file_path, params), target_path, target_bitrate, min_psnr)
+        else:
+            encoder = encoder_settings(encoding, target_bitrate)
+        # frames are encoded while they are processed, no second compression pass
+        output_path = process_video(
+            target_path, speed_percentage, params, width, height, params["max_frames"], file_path,
+            workers=max(WORKERS // filter_jobs, 1), target_bitrate=target_bitrate,
+            on_frames_done=frames_done, profile=profile, chunks=chunks, encoder=encoder,
+            subscribers=subscribers, static_threshold=static_threshold, variants=variants,
+        )
+        if stop_script:
+            raise RuntimeError("stopped")
+        for path in output_paths(output_path):
+            print(f"{path}: {os.path.getsize(path) / 1024000:.3f} MB")
+            manifest.record(file_path, path, settings, encoder=encoder)
+        return output_path
+
+    jobs = run_batch(
+        outdated(file_paths), run_job, filter_jobs=filter_jobs, encode_jobs=encode_jobs,
+        should_stop=lambda: stop_script, on_update=on_update,
+    )
+    jobs += [new_job(file_path, SKIPPED) for file_path in skipped]
+    print(batch_summary(jobs))
+    builtins.active_profile = None
+    if profile_report:
+        write_report(profiles, profile_report)
+        print(f"Profile written to {profile_report}")
+    return jobs
 
 
 def run_script():
     global stop_script
-    file_paths = list(Path(builtins.source_path_entry.get()).glob("*.*"))
-    target_path = builtins.target_path_entry.get()
-    speed_percentage = float(builtins.speed_slider[0].get())
+    from ui_functions import get_params_from_ui
+
     params, width, height = get_params_from_ui()
-    MAX_FRAMES = params["max_frames"]
     builtins.message.configure(text="Running...")
 
-    for file_path in tqdm(file_paths, desc="Files"):
-        if stop_script:
-            break
-        print(f"{file_path}: {os.path.getsize(file_path) / 1024000:.3f} MB")
-
-        output_path = process_video(
-            target_path, speed_percentage, params, width, height, MAX_FRAMES, file_path
-        )
-        if stop_script:
-            return
-        # --------------------------------
-        print(f"{file_path}: {os.path.getsize(file_path) / 1024000:.3f} MB")
-        print(f"Compressing {output_path}... into {output_path}_compressed.mp4")
-        builtins.message.configure(text=f"Compressing Image: {Path(file_path).name} ")
-        compress_with_ffmpeg(
-            output_path,
-            f"{output_path}_compressed.mp4",
-            target_bitrate=builtins.bitrate.get(),
-        )
-
-        # rename the compressed file to the original name, deletign the original...
-        shutil.move(f"{output_path}_compressed.mp4", output_path)
+    def show_job(job):
+        builtins.message.configure(text=f"{job['state'].capitalize()}: {job['file_path'].name}")
+
+    process_directory(
+        builtins.source_path_entry.get(),
+        builtins.target_path_entry.get(),
+        params,
+        speed_percentage=float(builtins.speed_slider[0].get()),
+        target_bitrate=builtins.bitrate.get(),
+        filter_jobs=max(int(builtins.filter_jobs.get()), 1),
+        encode_jobs=max(int(builtins.encode_jobs.get()), 1),
+        on_update=show_job,
+        profile_report=builtins.profile_report.get() or None,
+        encoding=builtins.encoding.get() or ENCODING,
+        on_progress=lambda event: builtins.message.configure(text=event.text()),
+        static_threshold=float(builtins.static_threshold.get()) if builtins.static_threshold.get() else None,
+    )
+    if stop_script:
+        return
 
     stop_script = False
     builtins.message.configure(text="Done!")
@@ -100,31 +324,282 @@ def run_script():
     cv2.destroyAllWindows()
 
 
+def tuned_encoder(file_path, params, work_dir, target_bitrate=BITRATE, min_psnr=None):
+    # sample runs spread over the file, processed the way the real encode will see them
+    video_capture = cv2.VideoCapture(str(file_path))
+    total_frames = min(probe_video(file_path, video_capture)["frame_count"], params["max_frames"])
+    frame_rate = probe_video(file_path)["fps"]
+    frames = []
+    for sample in range(TUNING_SAMPLES):
+        start_frame = max(total_frames - TUNING_RUN, 0) * sample // max(TUNING_SAMPLES - 1, 1)
+        video_capture.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        for _ in range(TUNING_RUN):
+            ret, frame = video_capture.read()
+            if not ret:
+                break
+            frames.append(fix_frame(frame, **params))
+    video_capture.release()
+    if not frames:
+        raise RuntimeError("no frames could be read")
+    encoder, results = tune_encoder(frames, frame_rate, str(work_dir), target_bitrate=target_bitrate, min_psnr=min_psnr)
+    for result in results:
+        print(
+            f"{result['encoder']['preset']:>9} crf {result['encoder']['crf_value']:>2}: "
+            f"{result['kbps']:9.0f} kbps {result['psnr']:6.2f} dB {result['encode_fps']:7.1f} fps"
+        )
+    print(f"{Path(file_path).name}: encoding with preset {encoder['preset']}, crf {encoder['crf_value']}")
+    return encoder
+
+
+def filter_frames(frames, out, params, n_frames, profile=None, should_stop=lambda: False, desc="Loading Frames", detector=None):
+    # `out` and `params` may be lists, one writer per params dict (see fix_frame_variants)
+    outs = out if isinstance(out, list) else [out]
+    variants = params if isinstance(params, list) else [params]
+    # each frame is written before the next one reuses the buffers
+    workspaces = [FrameWorkspace() for _ in variants]
+    outputs = None
+    for frame in tqdm(frames, total=n_frames, desc=desc):
+        if should_stop():
+            break
+        timings = {} if profile is not None else None
+        static = detector is not None and timed(timings, "static_check", detector.is_static, frame)
+        # a static frame skips fix_frame, so `outputs` (and the workspace buffers) still hold the last ones
+        if not static or outputs is None:
+            outputs = fix_frame_variants(frame, variants, timings=timings, workspaces=workspaces)
+        for writer, fixed in zip(outs, outputs):
+            timed(timings, "write", writer.write, fixed)
+        if profile is not None:
+            profile.record_frame(timings)
+
+
+def variant_output_path(output_path, suffix: str) -> str:
+    output_path = Path(output_path)
+    return str(output_path.with_name(f"{output_path.stem}{suffix}{output_path.suffix}"))
+
+
+def file_backend(file_path, params):
+    # backend "auto" is decided once per file, from its first frame, in this process: worker
+    # processes and chunks then all render with the same backend (UMat and numpy can differ by
+    # a level) instead of each timing its own while the others keep the cores busy
+    if params.get("backend") != AUTO_BACKEND:
+        return params
+    frame = cached_frame(file_path, 0)
+    return resolve_backend(frame, params) if frame is not None else {**params, "backend": "numpy"}
+
+
+def output_variants(output_path, params, encoder, variants=None):
+    """(output path, fix_frame params, encoder settings) of the main output and every variant.
+
+    A variant is a dict with a "suffix" for its file name, an optional "bitrate", and any
+    fix_frame params it changes, e.g. {"suffix": "_1080p", "width": 1920, "height": 1080}.
+    """
+    outputs = [(output_path, params, encoder)]
+    for variant in variants or []:
+        overrides = {key: value for key, value in variant.items() if key not in ("suffix", "bitrate")}
+        outputs.append((
+            variant_output_path(output_path, variant["suffix"]),
+            {**params, **overrides},
+            {**encoder, "target_bitrate": variant.get("bitrate", encoder["target_bitrate"])},
+        ))
+    return outputs
+
+
 def process_video(
-    target_path, speed_percentage, params, width, height, MAX_FRAMES, file_path
+    target_path, speed_percentage, params, width, height, MAX_FRAMES, file_path,
+    workers=WORKERS, target_bitrate=BITRATE, on_frames_done=None, profile=None, chunks=1, encoder=None,
+    subscribers=(), static_threshold=None, variants=None,
 ):
+    # with `variants` (see output_variants) the same decoded frames also go to those outputs,
+    # sharing every fix_frame stage they have in common with each other
     video_capture = cv2.VideoCapture(str(file_path))
 
-    total_frames = int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT))
-    frame_rate = video_capture.get(cv2.CAP_PROP_FPS)
-    frame_rate = int((speed_percentage+100)/100 * frame_rate)
+    probe = probe_video(file_path, video_capture)
+    total_frames = probe["frame_count"]
+    # speed keeps the source frame rate and drops frames instead
+    frame_rate = probe["fps"]
     output_path = fix_output_path_name(target_path, file_path)
-    out = cv2.VideoWriter(output_path, fourcc, frame_rate, (width, height))
-    
-    frame_count = list(range(min(total_frames, MAX_FRAMES)))
-    for _ in tqdm(frame_count, desc="Loading Frames"):
+    # written under a temporary name and renamed once complete
+    temp_output_path = partial_path(output_path)
+    # the frame count is only the progress estimate; decoding runs to the end of the stream
+    estimated_frames = len(kept_frame_indices(min(total_frames, MAX_FRAMES), speed_percentage))
+    encoder = encoder or encoder_settings(target_bitrate=target_bitrate)
+    detector = StaticFrameDetector(static_threshold) if static_threshold is not None else None
+    params = file_backend(file_path, params)
+    outputs = [
+        (path, file_backend(file_path, output_params), output_encoder)
+        for path, output_params, output_encoder in output_variants(output_path, params, encoder, variants)
+    ]
+    temp_paths = [partial_path(path) for path, _, _ in outputs]
+
+    if chunks > 1:
+        if variants:
+            video_capture.release()
+            raise ValueError("output variants cannot be combined with chunks")
+        # the chunk encoders run in other processes, so `subscribers` get no events from them
+        video_capture.release()
+        returncode = process_video_chunks(
+            file_path, temp_output_path, params, speed_percentage, min(total_frames, MAX_FRAMES), MAX_FRAMES,
+            frame_rate, chunks, encoder=encoder, profile=profile, detector=detector,
+        )
+        if on_frames_done is not None:
+            on_frames_done()
+    else:
+        outs = [
+            FFmpegWriter(temp_path, frame_rate, subscribers=subscribers, report_as=path, **output_encoder)
+            for temp_path, (path, _, output_encoder) in zip(temp_paths, outputs)
+        ]
+        variant_params = [output_params for _, output_params, _ in outputs]
+        frames = prefetch(planned_frames(video_capture, kept_indices(speed_percentage, stop=MAX_FRAMES), profile))
+        try:
+            if workers > 1:
+                process_frames_parallel(
+                    frames, outs, variant_params, estimated_frames,
+                    workers=workers, should_stop=lambda: stop_script, profile=profile, detector=detector,
+                )
+            else:
+                filter_frames(
+                    frames, outs, variant_params, estimated_frames, profile,
+                    should_stop=lambda: stop_script, detector=detector,
+                )
+        except BaseException:
+            # e.g. a BrokenPipeError from one encoder: the other encoders must not be left running
+            for out in outs:
+                out.release()
+            for temp_path in temp_paths:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            raise
+        finally:
+            # Release resources; the prefetch thread must be done with the capture first
+            frames.close()
+            video_capture.release()
+        if on_frames_done is not None:
+            on_frames_done()
+        start = time.perf_counter()
+        for out in outs:
+            out.release()
+        returncodes = [out.returncode for out in outs]
+        returncode = None if None in returncodes else next((code for code in returncodes if code != 0), 0)
+        if profile is not None:
+            # the encoder flush after the last frame; the rest of the encode shows up in "write"
+            profile.record("encode", time.perf_counter() - start)
+    if detector is not None:
+        print(f"{Path(file_path).name}: {detector.summary()}")
+    if profile is not None:
+        profile.reused_frames = detector.reused if detector is not None else 0
+        profile.finish()
+    if stop_script or returncode != 0:
+        for temp_path in temp_paths:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        if returncode is None:
+            raise RuntimeError("no frames could be read")
         if not stop_script:
-            frame = video_capture.read()[1]
-            fixed = fix_frame_process((frame, params))
-            out.write(fixed)
-    
-
-        # Release resources
-    video_capture.release()
-    out.release()
+            raise RuntimeError(f"ffmpeg failed with return code {returncode}")
+        return output_path
+    for temp_path, (path, _, _) in zip(temp_paths, outputs):
+        os.replace(temp_path, path)
     return output_path
 
 
+# ==========================   CHUNKED     ================================
+# A long file can be split into keyframe-aligned ranges, each filtered and encoded by its own
+# process with its own capture and ffmpeg encoder, and then joined with the concat demuxer.
+
+
+def chunk_starts(file_path, frame_count: int, frame_rate: float, chunks: int) -> list:
+    # boundaries snap to the nearest keyframe, so each worker's seek lands on a keyframe
+    targets = np.arange(1, chunks) * frame_count // chunks
+    times = keyframe_times(str(file_path))
+    if times:
+        keyframes = np.round((np.array(times) - times[0]) * frame_rate).astype(np.int64)
+        targets = keyframes[np.abs(keyframes[None, :] - targets[:, None]).argmin(axis=1)]
+    return sorted({0, *(int(start) for start in targets if 0 < start < frame_count)})
+
+
+def _process_chunk(
+    file_path, start_frame, stop_frame, speed_percentage, estimated_frames, params, segment_path,
+    frame_rate, encoder, stop_event, profiling, static_threshold,
+):
+    video_capture = cv2.VideoCapture(str(file_path))
+    if start_frame:
+        video_capture.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    out = FFmpegWriter(segment_path, frame_rate, **encoder)
+    profile = FileProfile(file_path) if profiling else None
+    detector = StaticFrameDetector(static_threshold) if static_threshold is not None else None
+    frame_indices = kept_indices(speed_percentage, start_frame, stop_frame)
+    frames = prefetch(planned_frames(video_capture, frame_indices, profile, start=start_frame))
+    try:
+        filter_frames(
+            frames, out, params, estimated_frames, profile,
+            should_stop=stop_event.is_set, desc=f"Chunk from frame {start_frame}", detector=detector,
+        )
+    finally:
+        frames.close()
+        video_capture.release()
+        out.release()
+    return out.returncode, profile, detector
+
+
+def process_video_chunks(
+    file_path, output_path, params, speed_percentage, frame_count, max_frames, frame_rate, chunks,
+    encoder=None, profile=None, detector=None,
+):
+    """Process the frames of `file_path` kept at `speed_percentage` in `chunks` processes into
+    `output_path`; returns 0 on success.
+
+    `frame_count` (from the header) only places the chunk boundaries: the last chunk runs to the
+    end of the stream (or `max_frames`). Each chunk gets its own copy of `detector`'s threshold;
+    their counts are added to `detector`.
+    """
+    encoder = encoder or encoder_settings(target_bitrate=BITRATE)
+    starts = chunk_starts(file_path, frame_count, frame_rate, chunks)
+    ranges = list(zip(starts, [*starts[1:], max_frames]))
+    kept = kept_frame_indices(frame_count, speed_percentage)  # for the progress estimates
+    output = Path(output_path)
+    segment_paths = [
+        str(output.with_name(f"{output.stem}.chunk{number:03d}{output.suffix}")) for number in range(len(ranges))
+    ]
+    with multiprocessing.Manager() as manager:
+        stop_event = manager.Event()
+        try:
+            with ProcessPoolExecutor(max_workers=len(ranges) or 1) as pool:
+                futures = [
+                    pool.submit(
+                        _process_chunk, str(file_path), start, stop, speed_percentage,
+                        int(np.count_nonzero((kept >= start) & (kept < stop))),
+                        params, segment_path, frame_rate, encoder, stop_event, profile is not None,
+                        detector.threshold if detector is not None else None,
+                    )
+                    for (start, stop), segment_path in zip(ranges, segment_paths)
+                ]
+                while wait(futures, timeout=0.5).not_done:
+                    if stop_script:
+                        stop_event.set()
+                results = [future.result() for future in futures]
+            if not results:
+                return None
+            for returncode, chunk_profile, chunk_detector in results:
+                if returncode != 0:
+                    return returncode
+                if profile is not None:
+                    profile.merge(chunk_profile)
+                if detector is not None:
+                    detector.reused += chunk_detector.reused
+                    detector.processed += chunk_detector.processed
+            if stop_script:
+                return None
+            start = time.perf_counter()
+            concat_segments([os.path.abspath(segment) for segment in segment_paths], output_path)
+            if profile is not None:
+                profile.record("concat", time.perf_counter() - start)
+            return 0
+        finally:
+            for segment_path in segment_paths:
+                if os.path.exists(segment_path):
+                    os.remove(segment_path)
+
+
 def fix_output_path_name(target_path, file_path):
     return (
         str(Path(target_path) / file_path.name)
@@ -136,6 +611,8 @@ def fix_output_path_name(target_path, file_path):
 
 
 def stop_running():
+    import customtkinter as ctk  # type: ignore
+
     global stop_script
     stop_script = True
     builtins.stop_button.pack_forget()
@@ -144,6 +621,8 @@ def stop_running():
 
 
 def start_script():
+    import customtkinter as ctk  # type: ignore
+
     global stop_script
     stop_script = False
 
@@ -154,6 +633,17 @@ def start_script():
 
 
 def main():
+    import customtkinter as ctk  # type: ignore
+    from ui_functions import (
+        center_window,
+        create_slider,
+        create_entry_with_label,
+        update_loaded_frame,
+        load_first_frame,
+        update_frame_loading_on_params_change,
+        PreviewRenderer,
+    )
+
     root = ctk.CTk()
     root.title("Video Frame Fixer")
 
@@ -182,6 +672,7 @@ def main():
         fg_color="grey",
     ).pack(side=ctk.LEFT, padx=10)
 
+    builtins.timeline_slider = create_slider(left_frame, "Timeline %", 0, 100, 0)
     builtins.speed_slider = create_slider(left_frame, "Speed %", 0, 100, 30)
     builtins.zoom_slider = create_slider(left_frame, "Zoom %", 0, 100, 40)
     builtins.shift_left = create_slider(left_frame, "Shift →", -1000, 1000, 0)
@@ -194,6 +685,11 @@ def main():
 
     builtins.max_frames = create_entry_with_label(left_frame, "max frames:", MAX_FRAMES)
     builtins.bitrate = create_entry_with_label(left_frame, "bitrate:", BITRATE)
+    builtins.encoding = create_entry_with_label(left_frame, "encoding:", ENCODING)
+    builtins.static_threshold = create_entry_with_label(left_frame, "static threshold:", "")
+    builtins.filter_jobs = create_entry_with_label(left_frame, "filter jobs:", FILTER_JOBS)
+    builtins.encode_jobs = create_entry_with_label(left_frame, "encode jobs:", ENCODE_JOBS)
+    builtins.profile_report = create_entry_with_label(left_frame, "profile report:", "")
     builtins.width_entry = create_entry_with_label(left_frame, "width:", "3840")
     builtins.height_entry = create_entry_with_label(left_frame, "height:", "2160")
 
@@ -213,6 +709,8 @@ def main():
     messages_frame.pack(side=ctk.RIGHT, padx=10, pady=10, fill=ctk.BOTH, expand=True)
     builtins.message = ctk.CTkLabel(messages_frame, text="Not started", width=100)
     builtins.message.pack()
+    builtins.preview_message = ctk.CTkLabel(messages_frame, text="", width=100)
+    builtins.preview_message.pack()
 
     # -----------------------------------------------------------
     builtins.right_frame = ctk.CTkFrame(root, width=right_width)
@@ -221,9 +719,12 @@ def main():
     )
 
     center_window(root, width=left_width + right_width, height=800)
+    builtins.preview_renderer = PreviewRenderer(root)
 
     def repeat_update(time=100):
         update_frame_loading_on_params_change()
+        if getattr(builtins, "active_profile", None) is not None:
+            builtins.message.configure(text=builtins.active_profile.live_text())
         root.after(time, repeat_update)
 
     def on_closing():
@@ -238,5 +739,76 @@ def main():
     root.mainloop()
 
 
+def cli(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Video Frame Fixer. Without a source and target, opens the GUI."
+    )
+    parser.add_argument("source", nargs="?", help="directory with the videos to process")
+    parser.add_argument("target", nargs="?", help="directory for the processed videos")
+    parser.add_argument("--preset", help="JSON file with fix_frame params (see DEFAULT_PARAMS)")
+    parser.add_argument("--speed", type=float, default=DEFAULT_SPEED, help="speed-up percentage")
+    parser.add_argument("--bitrate", default=BITRATE)
+    parser.add_argument(
+        "--encoding", default=ENCODING, choices=[*ENCODING_PROFILES, AUTO_PROFILE],
+        help="encoder profile; auto picks CRF/preset per file from sample encodes",
+    )
+    parser.add_argument("--min-psnr", type=float, help="with --encoding auto, tune for this quality instead of --bitrate")
+    parser.add_argument(
+        "--static-threshold", type=float,
+        help="reuse the previous output for frames whose 16x16 block means change by at most this much",
+    )
+    parser.add_argument(
+        "--variants",
+        help='JSON file with a list of extra outputs per file, e.g. [{"suffix": "_1080p", "width": 1920, "height": 1080}]',
+    )
+    parser.add_argument("--progress-log", help="append encoder progress events to this JSON lines file")
+    parser.add_argument("--filter-jobs", type=int, default=FILTER_JOBS)
+    parser.add_argument("--encode-jobs", type=int, default=ENCODE_JOBS)
+    parser.add_argument("--profile", help="write per-stage timings to this .json or .csv file")
+    parser.add_argument("--force", action="store_true", help="redo outputs the manifest marks as up to date")
+    parser.add_argument("--chunks", type=int, default=1, help="split every file into this many parallel parts")
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="keep running and process every clip that appears or changes in the source (Ctrl+C to stop)",
+    )
+    parser.add_argument("--poll-seconds", type=float, default=POLL_SECONDS, help="with --watch, how often the source is listed")
+    parser.add_argument(
+        "--settle-seconds", type=float, default=SETTLE_SECONDS,
+        help="with --watch, how long a file's size must stay the same before it is processed",
+    )
+    args = parser.parse_args(argv)
+
+    if args.source is None:
+        main()
+        return
+    if args.target is None:
+        parser.error("a target directory is required with a source directory")
+    if args.variants and args.chunks > 1:
+        parser.error("--variants cannot be combined with --chunks")
+
+    jobs = process_directory(
+        args.source,
+        args.target,
+        load_preset(args.preset) if args.preset else None,
+        speed_percentage=args.speed,
+        target_bitrate=args.bitrate,
+        filter_jobs=max(args.filter_jobs, 1),
+        encode_jobs=max(args.encode_jobs, 1),
+        on_update=lambda job: print(f"{job['state']}: {job['file_path'].name}"),
+        profile_report=args.profile,
+        force=args.force,
+        chunks=max(args.chunks, 1),
+        encoding=args.encoding,
+        min_psnr=args.min_psnr,
+        progress_log=args.progress_log,
+        static_threshold=args.static_threshold,
+        variants=load_variants(args.variants) if args.variants else None,
+        file_paths=watched_files(
+            args.source, args.poll_seconds, args.settle_seconds, should_stop=lambda: stop_script
+        ) if args.watch else None,
+    )
+    return int(any(job["state"] == FAILED for job in jobs))
+
+
 if __name__ == "__main__":
-    main()
+    raise SystemExit(cli())
@@ -0,0 +1,57 @@
+import time
+from pathlib import Path
+
+# Hot-folder mode: the source directory is polled and every clip that is new or changed is
+# handed to the batch as soon as it is complete. A file counts as complete once its size and
+# mtime have stayed the same for `settle_seconds`, so a clip that is still being copied onto
+# the share is not picked up half written. Polling (rather than inotify) also works on SMB/NFS
+# shares, where change notifications from other machines often never arrive.
+
+POLL_SECONDS = 5.0
+SETTLE_SECONDS = 15.0
+
+
+def _signature(path: Path):
+    stat = path.stat()
+    return stat.st_size, stat.st_mtime_ns
+
+
+def watched_files(source_path, poll_seconds=POLL_SECONDS, settle_seconds=SETTLE_SECONDS, should_stop=lambda: False):
+    """Yield the files of `source_path` (now and later) once they are complete; ends with should_stop()."""
+    source_path = Path(source_path)
+    seen = {}  # path -> (signature, time it was first seen with that signature)
+    handed_out = {}  # path -> signature it was yielded with
+    while not should_stop():
+        try:
+            listing = list(source_path.glob("*.*"))
+        except OSError as error:  # e.g. the share dropped out; try again at the next poll
+            print(f"Cannot list {source_path}: {error}")
+            listing = None
+        if listing is not None:
+            yield from _complete_files(listing, seen, handed_out, settle_seconds)
+
+        deadline = time.monotonic() + poll_seconds
+        while time.monotonic() < deadline and not should_stop():
+            time.sleep(min(0.5, poll_seconds))
+
+
+def _complete_files(listing, seen, handed_out, settle_seconds):
+    now = time.monotonic()
+    current = {}
+    for path in listing:
+        if path.name.startswith("."):  # temp names of copy tools
+            continue
+        try:
+            current[path] = _signature(path)
+        except OSError:  # removed since the listing
+            pass
+    for path, signature in current.items():
+        if path not in seen or seen[path][0] != signature:
+            seen[path] = (signature, now)
+    for path in [path for path in seen if path not in current]:
+        del seen[path]
+
+    for path, (signature, since) in sorted(seen.items()):
+        if handed_out.get(path) != signature and now - since >= settle_seconds:
+            handed_out[path] = signature
+            yield path